@@ -0,0 +1,76 @@
+from event import CalendarQueue, EventPriorityQueue
+from simulator import MAX_LINK_LATENCY, MIN_LINK_LATENCY, Simulator
+import numpy as np
+import sys
+import time
+
+
+def make_queue(scheduler):
+    """Create an empty event queue for the given backend name."""
+    if scheduler == "calendar":
+        return CalendarQueue(bucket_width=MIN_LINK_LATENCY)
+    return EventPriorityQueue()
+
+
+def hold_benchmark(scheduler, size, operations):
+    """
+    Time the hold model on an event queue.
+
+    The queue is filled with `size` pending events, then each operation pops
+    the earliest one and pushes a successor delayed by a sampled link latency.
+
+    Returns the mean time per pop/push pair in microseconds.
+    """
+    delays = (
+        np.random.uniform(MIN_LINK_LATENCY, MAX_LINK_LATENCY, size + operations)
+        + np.random.exponential(96 / 5, size + operations)
+    ).tolist()
+    queue = make_queue(scheduler)
+    for delay in delays[:size]:
+        queue.push(delay, 0, 0, None)
+    start = time.perf_counter()
+    for delay in delays[size:]:
+        now = queue.pop()[0]
+        queue.push(now + delay, 0, 0, None)
+    return (time.perf_counter() - start) / operations * 1e6
+
+
+def simulation_benchmark(scheduler, n, max_events):
+    """Return the wall time in seconds of a full simulation using the given backend."""
+    simulator = Simulator(
+        n,
+        0.5,
+        0.5,
+        min_transactions_per_mining=10,
+        transaction_mean_gap=10,
+        max_events=max_events,
+        attacker_hash1=0.3,
+        attacker_hash2=0.2,
+        scheduler=scheduler,
+    )
+    start = time.perf_counter()
+    simulator.simulate()
+    return time.perf_counter() - start
+
+
+def arg_value(flag, default):
+    return int(sys.argv[sys.argv.index(flag) + 1]) if flag in sys.argv else default
+
+
+# Usage: python3 benchmark.py [--size SIZE] [--operations OPS] [--peers PEERS] [--events EVENTS]
+if __name__ == "__main__":
+    size = arg_value("--size", 100000)
+    operations = arg_value("--operations", 200000)
+    peers = arg_value("--peers", 50)
+    events = arg_value("--events", 20000)
+
+    for scheduler in ("heap", "calendar"):
+        print(
+            f"{scheduler}: hold model with {size} pending events: "
+            f"{hold_benchmark(scheduler, size, operations):.2f} us per operation"
+        )
+    for scheduler in ("heap", "calendar"):
+        print(
+            f"{scheduler}: simulation with {peers} peers and {events} events: "
+            f"{simulation_benchmark(scheduler, peers, events):.2f} s"
+        )
@@ -2,98 +2,285 @@ import hashlib
 import matplotlib.pyplot as plt
 import networkx as nx
 from datetime import datetime
-import random
+import functools
+import itertools
+
+GENESIS_BLOCK_ID = 0
+BLOCK_ID_MODES = ("counter", "hash")
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def transaction_hash(txn):
+    """Return the SHA-256 digest of a transaction."""
+    return hashlib.sha256(
+        f"{txn.txn_id}:{txn.sender}:{txn.receiver}:{txn.amount}".encode()
+    ).digest()
+
+
+@functools.lru_cache(maxsize=1 << 12)
+def merkle_root(transactions):
+    """
+    Return the Merkle root of a tuple of transactions as a hex string.
+
+    Miners often build blocks from the same pool contents, so roots are
+    cached per transaction set.
+    """
+    level = [transaction_hash(txn) for txn in transactions]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [
+            hashlib.sha256(level[i] + level[i + 1]).digest()
+            for i in range(0, len(level), 2)
+        ]
+    return level[0].hex()
 
 
 class Block:
+    __slots__ = (
+        "block_id", "previous_block_id", "transactions", "miner_id", "height", "jumps", "index"
+    )
+
     def __init__(self, block_id, previous_block_id, transactions, miner_id=None):
         self.block_id = block_id
         self.previous_block_id = previous_block_id
-        self.transactions = transactions
+        self.transactions = tuple(transactions)
         self.miner_id = miner_id
+        self.height = None  # Set when the block is stored in a BlockDAG
+        self.jumps = None  # jumps[k] is the ancestor 2**k blocks below
+        self.index = None  # Position of the block in its BlockDAG
 
     def __eq__(self, other):
-        return (
-            self.block_id == other.block_id
-            and self.previous_block_id == other.previous_block_id
-            and self.transactions[:-1] == other.transactions[:-1]
-            and self.miner_id == other.miner_id
-        )
+        return self.block_id == other.block_id
 
+    def __hash__(self):
+        return hash(self.block_id)
 
-class Blockchain:
-    def __init__(self):
-        self.genesis_block = Block("0", None, [])
+
+class BlockDAG:
+    def __init__(self, block_id_mode="counter"):
+        """
+        Initialize a BlockDAG object.
+
+        The DAG stores every block of the network once, with its height and
+        ancestor pointers, and is shared by all nodes. Each node only keeps a
+        Blockchain view recording which of these blocks it has received.
+
+        Parameters:
+        - block_id_mode: "counter" for sequential integer block IDs, or "hash"
+          for SHA-256 IDs over the Merkle root of the block's transactions.
+        """
+        if block_id_mode not in BLOCK_ID_MODES:
+            raise ValueError(f"Unknown block ID mode: {block_id_mode}")
+        self.block_id_mode = block_id_mode
+        self.genesis_block = Block(GENESIS_BLOCK_ID, None, [])
+        self.genesis_block.height = 0
+        self.genesis_block.jumps = []
+        self.genesis_block.index = 0
         self.blocks = [self.genesis_block]
+        self.block_index = {self.genesis_block.block_id: self.genesis_block}
+        self.transaction_blocks = {}  # Transaction ID -> indices of the blocks holding it
+        self.block_ids = itertools.count(GENESIS_BLOCK_ID + 1)  # Sequence numbers of new blocks
 
-    def add_block(self, block):
+    def add(self, block):
+        """
+        Store a block whose parent is already stored and set its height.
+
+        Blocks are created on top of a block their miner holds, so the parent
+        is always present and heights never have to wait for an orphan.
+        """
+        if block.index is not None:
+            return
+        parent = self.block_index[block.previous_block_id]
+        block.height = parent.height + 1
+        block.jumps = self._build_jumps(parent)
+        block.index = len(self.blocks)
         self.blocks.append(block)
+        self.block_index[block.block_id] = block
+        for txn in block.transactions:
+            self.transaction_blocks.setdefault(txn.txn_id, []).append(block.index)
 
-    def create_block(self, transactions, node, mine_block_id=None, miner_id=None):
-        # Create a new block with transactions
-        temp = str(random.getrandbits(32))
-        transactions_string = "".join(
-            [
-                str(txn.sender) + str(txn.receiver) + str(txn.amount) + str(miner_id)
-                for txn in transactions[:-1]
-            ]
+    def _build_jumps(self, parent):
+        # jumps[k + 1] is two hops of jumps[k], read from the ancestors' own pointers
+        jumps = [parent]
+        while len(jumps[-1].jumps) >= len(jumps):
+            jumps.append(jumps[-1].jumps[len(jumps) - 1])
+        return jumps
+
+    def get_ancestor(self, block, height):
+        """Return the ancestor of a stored block at the given height in O(log depth)."""
+        if height < 0 or height > block.height:
+            return None
+        while block.height > height:
+            block = block.jumps[(block.height - height).bit_length() - 1]
+        return block
+
+    def is_ancestor(self, ancestor, block):
+        """Check if ancestor lies on the chain ending at block (a block is its own ancestor)."""
+        found = self.get_ancestor(block, ancestor.height)
+        return found is not None and found.block_id == ancestor.block_id
+
+    def common_ancestor(self, block1, block2):
+        """Return the lowest common ancestor of two stored blocks."""
+        if block1.height > block2.height:
+            block1 = self.get_ancestor(block1, block2.height)
+        elif block2.height > block1.height:
+            block2 = self.get_ancestor(block2, block1.height)
+        if block1.block_id == block2.block_id:
+            return block1
+        for k in range(len(block1.jumps) - 1, -1, -1):
+            if k < len(block1.jumps) and block1.jumps[k].block_id != block2.jumps[k].block_id:
+                block1, block2 = block1.jumps[k], block2.jumps[k]
+        return block1.jumps[0]
+
+    def new_block_id(self, transactions, previous_block_id, miner_id):
+        """Return an ID for a new block according to the block ID mode."""
+        if self.block_id_mode == "counter":
+            return next(self.block_ids)
+        header = f"{merkle_root(tuple(transactions))}:{previous_block_id}:{miner_id}:{next(self.block_ids)}"
+        return hashlib.sha256(header.encode()).hexdigest()
+
+
+class Blockchain:
+    def __init__(self, dag):
+        """
+        Initialize a Blockchain object, one node's view of the shared block DAG.
+
+        The view holds a bitset over DAG positions marking the blocks the node
+        has received, the received blocks still waiting for an ancestor, and
+        the tip of the node's longest chain.
+
+        Parameters:
+        - dag: BlockDAG the node's blocks are stored in.
+        """
+        self.dag = dag
+        self.genesis_block = dag.genesis_block
+        self.visible = bytearray(b"\x01")  # Bit k is set once DAG block k is received
+        self.orphans = {}  # Missing parent ID -> blocks waiting for it
+        self.orphan_ids = set()
+        self.tip = self.genesis_block
+        self.version = 0  # Bumped whenever the tip moves
+
+    def _is_visible(self, index):
+        byte = index >> 3
+        return byte < len(self.visible) and self.visible[byte] >> (index & 7) & 1 == 1
+
+    def _set_visible(self, index):
+        byte = index >> 3
+        if byte >= len(self.visible):
+            self.visible.extend(bytes(max(byte + 1, 2 * len(self.visible)) - len(self.visible)))
+        self.visible[byte] |= 1 << (index & 7)
+
+    def contains(self, block):
+        """Check if the node has received a block."""
+        return block.index is not None and self._is_visible(block.index)
+
+    def has_transaction(self, txn_id):
+        """Check if a transaction is in any block the node has received."""
+        return any(
+            self._is_visible(index) for index in self.dag.transaction_blocks.get(txn_id, ())
         )
 
-        block_id = hashlib.sha256((transactions_string + temp).encode()).hexdigest()
+    @property
+    def blocks(self):
+        """Blocks received by the node, in the order they were created."""
+        return [block for block in self.dag.blocks if self._is_visible(block.index)]
+
+    def add_block(self, block):
+        """
+        Add a block and update the tip of the longest chain.
+
+        Blocks whose parent has not arrived yet are held as orphans and are
+        connected once the parent is added.
+        """
+        self.dag.add(block)
+        if self._is_visible(block.index):
+            return
+        self._set_visible(block.index)
+        parent = block.jumps[0]
+        if not self._is_visible(parent.index) or parent.block_id in self.orphan_ids:
+            self.orphan_ids.add(block.block_id)
+            self.orphans.setdefault(block.previous_block_id, []).append(block)
+            return
+        pending = [block]
+        while pending:
+            current = pending.pop()
+            self.orphan_ids.discard(current.block_id)
+            if current.height > self.tip.height:
+                self.tip = current
+                self.version += 1
+            pending.extend(self.orphans.pop(current.block_id, []))
+
+    def is_connected(self, block):
+        """Check if a block is linked to the genesis block in this chain."""
+        return self.contains(block) and block.block_id not in self.orphan_ids
 
-        if mine_block_id:
+    def get_ancestor(self, block, height):
+        """Return the ancestor of a block at the given height in O(log depth)."""
+        return self.dag.get_ancestor(block, height)
+
+    def is_ancestor(self, ancestor, block):
+        """Check if ancestor lies on the chain ending at block (a block is its own ancestor)."""
+        return self.dag.is_ancestor(ancestor, block)
+
+    def common_ancestor(self, block1, block2):
+        """Return the lowest common ancestor of two blocks."""
+        return self.dag.common_ancestor(block1, block2)
+
+    def chain_length(self, end_block=None):
+        """Return len(self.get_longest_chain(end_block)) without building the chain."""
+        length = 0
+        block = self.tip if end_block is None else end_block
+        while block is not None:
+            if self.is_connected(block):
+                return length + block.height + 1
+            length += 1
+            block = self.find_block_by_id(block.previous_block_id)
+        return length
+
+    def new_block_id(self, transactions, previous_block_id, miner_id):
+        """Return an ID for a new block according to the block ID mode."""
+        return self.dag.new_block_id(transactions, previous_block_id, miner_id)
+
+    def create_block(self, transactions, node, mine_block_id=None, miner_id=None):
+        # Create a new block with transactions
+        if mine_block_id is not None:
             previous_block_id = mine_block_id
-        elif not self.blocks:
-            previous_block_id = None
         else:
-            longest_chain = self.get_longest_chain()
-            previous_block_id = longest_chain[-1].block_id if longest_chain else None
+            previous_block_id = self.tip.block_id
 
+        block_id = self.new_block_id(transactions[:-1], previous_block_id, miner_id)
         new_block = Block(block_id, previous_block_id, transactions, miner_id)
+        self.dag.add(new_block)
         (
-            self.blocks.append(new_block)
+            self.add_block(new_block)
             if not node.selfish
             else node.pchain.append(new_block)
         )
         return new_block
 
     def get_longest_chain(self, end_block=None):
-        longest_chain = []
-        if end_block is not None:
-            current_chain = [end_block]
-            while current_chain[-1].previous_block_id is not None:
-                prev_block = self.find_block_by_id(current_chain[-1].previous_block_id)
-                if prev_block:
-                    current_chain.append(prev_block)
-                else:
-                    break
-            return current_chain[::-1]
-
-        for block in self.blocks:
-            current_chain = [block]
-            while current_chain[-1].previous_block_id is not None:
-                prev_block = self.find_block_by_id(current_chain[-1].previous_block_id)
-                if prev_block:
-                    current_chain.append(prev_block)
-                else:
-                    break
-            if len(current_chain) > len(longest_chain):
-                longest_chain = current_chain
-        return longest_chain[::-1]
+        """Return the chain ending at end_block, or at the current tip, from genesis onwards."""
+        current_chain = [self.tip if end_block is None else end_block]
+        while current_chain[-1].previous_block_id is not None:
+            prev_block = self.find_block_by_id(current_chain[-1].previous_block_id)
+            if prev_block is None:
+                break
+            current_chain.append(prev_block)
+        return current_chain[::-1]
 
     def find_block_by_id(self, block_id):
-        for block in self.blocks:
-            b = block.block_id
-            if b == block_id:
-                return block
-        return None
+        block = self.dag.block_index.get(block_id)
+        return block if block is not None and self.contains(block) else None
 
     def visualize(self, node_id):
         G = nx.DiGraph()
 
         for block in self.blocks:
             G.add_node(block.block_id)
-            if block.previous_block_id:
+            if block.previous_block_id is not None:
                 G.add_edge(block.previous_block_id, block.block_id)
 
         block_info = {block.block_id: block for block in self.blocks}
@@ -111,7 +298,7 @@ class Blockchain:
                 pos,
                 nodelist=[node],
                 node_size=1000,
-                node_color="red" if block.block_id == "0" else "lightgreen",
+                node_color="red" if block.block_id == GENESIS_BLOCK_ID else "lightgreen",
                 edgecolors="black",
             )
 
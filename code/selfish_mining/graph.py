@@ -1,50 +1,133 @@
-import random
 import networkx as nx
 import matplotlib.pyplot as plt
+import numpy as np
 import sys
+from rng import RandomService
 
 
-def generate_graph(n, min_edges=random.choice([3, 4, 5, 6])):
+class Graph:
+    def __init__(self, n):
+        """
+        Initialize an undirected Graph with 'n' nodes and no edges.
+
+        Edges are kept both as an edge list and as adjacency lists, and
+        to_csr() packs the adjacency lists into compressed sparse row arrays.
+        """
+        self.n = n
+        self.adjacency = [[] for _ in range(n)]
+        self.neighbours = [set() for _ in range(n)]
+        self.edges = []  # (i, j) pairs with i < j
+
+    def add_edge(self, i, j):
+        """Connect nodes 'i' and 'j', returning False if they already were."""
+        if i == j or j in self.neighbours[i]:
+            return False
+        self.adjacency[i].append(j)
+        self.adjacency[j].append(i)
+        self.neighbours[i].add(j)
+        self.neighbours[j].add(i)
+        self.edges.append((i, j) if i < j else (j, i))
+        return True
+
+    def degree(self, i):
+        """Return the number of edges of node 'i'."""
+        return len(self.adjacency[i])
+
+    def to_csr(self):
+        """
+        Return (indptr, indices): the neighbours of 'i' are indices[indptr[i]:indptr[i + 1]],
+        in increasing order so a neighbour's position can be found by bisection.
+        """
+        indptr = np.zeros(self.n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in self.adjacency])
+        indices = np.fromiter(
+            (j for row in self.adjacency for j in sorted(row)),
+            dtype=np.int64,
+            count=indptr[-1],
+        )
+        return indptr, indices
+
+
+class DisjointSet:
+    def __init__(self, n):
+        """Initialize a union-find structure over the elements 0..n-1."""
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x):
+        """Return the representative of the set containing 'x'."""
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Compress the path so later lookups are near constant time
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x, y):
+        """Merge the sets containing 'x' and 'y', returning False if already merged."""
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return False
+        if self.size[x] < self.size[y]:
+            x, y = y, x
+        self.parent[y] = x
+        self.size[x] += self.size[y]
+        return True
+
+
+def generate_graph(n, min_edges=None, rng=None):
     """
     Function to generate a random graph with 'n' nodes and at least 'min_edges' edges per node.
+    'rng' is a RandomStream; 'min_edges' is drawn from 3 to 6 when not given.
+
+    Nodes are visited in order and each one is connected to random nodes that
+    are still below 'min_edges' edges. The unsaturated nodes are kept in a
+    list with a position index, so a node is dropped in O(1) as soon as its
+    degree reaches 'min_edges'.
     """
-    graph = [[False] * n for _ in range(n)]  # Initialize an empty adjacency matrix
-    indices = [i for i in range(n)]  # List of node indices
+    if rng is None:
+        rng = RandomService().topology
+    if min_edges is None:
+        min_edges = rng.choice([3, 4, 5, 6])
+    graph = Graph(n)
+    open_nodes = list(range(n))  # Nodes with fewer than 'min_edges' edges
+    position = list(range(n))  # Index of each node in 'open_nodes', -1 once saturated
+
+    def close(node):
+        # Swap the node with the last open node and drop it
+        index = position[node]
+        last = open_nodes.pop()
+        if last != node:
+            open_nodes[index] = last
+            position[last] = index
+        position[node] = -1
+
     for i in range(n):
-        check = 0
-        # Count the number of existing edges for node i
-        for j in range(n):
-            if graph[i][j]:
-                check += 1
-        # Skip the node if it already has at least 'min_edges' edges
-        if check >= min_edges:
+        k = min_edges - graph.degree(i)  # Edges needed to meet the minimum requirement
+        if k <= 0:
             continue
-        # Calculate the number of edges needed to meet the minimum requirement
-        k = min_edges - check
-        copy = indices.copy()  # Make a copy of node indices
-        if i in copy:
-            copy.remove(i)  # Remove the current node from the list of available nodes
-        # Randomly select nodes to connect with node i until the minimum edge requirement is met
-        while k != 0 and copy:
-            choice = random.choice(
-                copy
-            )  # Randomly choose a node to connect with node i
-            if not graph[i][choice]:
-                graph[i][choice] = True  # Connect node i with the chosen node
-                graph[choice][i] = True  # Make the connection bidirectional
-                k -= 1  # Decrement the number of edges needed
-            copy.remove(
-                choice
-            )  # Remove the chosen node from the list of available nodes
-        # Remove nodes from the list of available nodes if they already have 'min_edges' edges
-        for g in indices:
-            c = 0
-            for j in range(n):
-                if graph[g][j]:
-                    c += 1
-            if c >= min_edges:
-                if g in indices:
-                    indices.remove(g)
+        # Random draws are cheap while most open nodes are valid targets; after
+        # a few misses fall back to listing the remaining candidates
+        misses = 0
+        while k > 0 and open_nodes and misses < 4 * min_edges:
+            choice = rng.choice(open_nodes)
+            if graph.add_edge(i, choice):
+                k -= 1
+                if graph.degree(choice) >= min_edges:
+                    close(choice)
+            else:
+                misses += 1
+        if k > 0:
+            candidates = [j for j in open_nodes if j != i and j not in graph.neighbours[i]]
+            while k > 0 and candidates:
+                choice = candidates.pop(rng.integers(0, len(candidates)))
+                graph.add_edge(i, choice)
+                k -= 1
+                if graph.degree(choice) >= min_edges:
+                    close(choice)
+        if position[i] != -1:
+            close(i)
     return graph
 
 
@@ -53,11 +136,8 @@ def visualize_graph(graph, att1=None, att2=None):
     Function to visualize a graph using NetworkX and Matplotlib.
     """
     G = nx.Graph()
-    # Add edges to the graph based on the adjacency matrix
-    for i, row in enumerate(graph):
-        for j, connected in enumerate(row):
-            if connected:
-                G.add_edge(i, j)
+    G.add_nodes_from(range(graph.n))
+    G.add_edges_from(graph.edges)
 
     # Prepare node colors
     node_colors = [
@@ -73,35 +153,40 @@ def visualize_graph(graph, att1=None, att2=None):
 
 def is_connected(graph):
     """
-    Function to check if a graph is connected using Depth-First Search (DFS).
+    Function to check if a graph is connected using union-find over its edges.
     """
+    components = DisjointSet(graph.n)
+    merges = sum(components.union(i, j) for i, j in graph.edges)
+    return merges == graph.n - 1 or graph.n == 0
 
-    def dfs(node):
-        visited[node] = True
-        # Traverse all neighbors of the current node
-        for neighbor in range(len(graph)):
-            if graph[node][neighbor] and not visited[neighbor]:
-                dfs(
-                    neighbor
-                )  # Recursively explore the neighbor if it has not been visited
 
-    visited = [False] * len(graph)  # Initialize visited array
-    dfs(0)  # Start DFS from node 0
-    # Check if all nodes were visited
-    return all(visited)
-
-
-def generate_connected_graph(n):
+def generate_connected_graph(n, rng=None):
     """
-    Function to generate a connected graph with 'n' nodes.
+    Function to generate a connected graph with 'n' nodes using the RandomStream 'rng'.
+
+    The components left by generate_graph are found with union-find and
+    joined by one extra edge each, between random members, so no graph is
+    ever thrown away.
     """
-    while True:
-        graph = generate_graph(n)  # Generate a random graph
-        if is_connected(graph):  # Check if the graph is connected
-            return graph  # Return the connected graph
+    if rng is None:
+        rng = RandomService().topology
+    graph = generate_graph(n, rng=rng)
+    components = DisjointSet(n)
+    for i, j in graph.edges:
+        components.union(i, j)
+    members = {}
+    for node in range(n):
+        members.setdefault(components.find(node), []).append(node)
+    groups = list(members.values())
+    # Attach every component to a random node of the part already joined
+    joined = list(groups[0]) if groups else []
+    for group in groups[1:]:
+        graph.add_edge(rng.choice(group), rng.choice(joined))
+        joined.extend(group)
+    return graph
 
 
 # Call the functions
-if sys.argv[1] == "--generate":
+if __name__ == "__main__" and sys.argv[1:2] == ["--generate"]:
     graph = generate_graph(10)  # Generate a random graph with 10 nodes
     visualize_graph(graph)  # Visualize the graph
@@ -14,11 +14,11 @@ if __name__ == "__main__":
         max_events=10000,  # Maximum number of events
         attacker_hash1=float(sys.argv[10]),  # Attacker 1 hashing power
         attacker_hash2=float(sys.argv[12]),  # Attacker 2 hashing power
+        seed=int(sys.argv[sys.argv.index("--seed") + 1])
+        if "--seed" in sys.argv
+        else None,  # Seed for a reproducible run
     )
 
-    attacker_1 = simulator.att1
-    attacker_2 = simulator.att2
-
     # Running the simulation
     simulator.simulate()
 
@@ -51,46 +51,10 @@ if __name__ == "__main__":
                     f"Invalid index. Index should be an integer from 0 to {int(sys.argv[2]) - 1}"
                 )
 
-    def find_block(block_id, blocks):
-        for block in blocks:
-            b = block.block_id
-            if b == block_id:
-                return block
-        return None
-
-    chain = simulator.nodes[0].blockchain.blocks
-    atb1 = 0
-    atb2 = 0
-    tat1 = 0
-    tat2 = 0
-    tbl = 0
-    tb = len(chain)
-    longest_chain = []
-    for block in chain:
-        if block.miner_id == attacker_1:
-            tat1 += 1
-        if block.miner_id == attacker_2:
-            tat2 += 1
-        current_chain = [block]
-        while current_chain[-1].previous_block_id is not None:
-            prev_block = find_block(current_chain[-1].previous_block_id, chain)
-            if prev_block:
-                current_chain.append(prev_block)
-            else:
-                break
-        if len(current_chain) > len(longest_chain):
-            atb1 = 0
-            atb2 = 0
-            tbl = 0
-            for block in current_chain:
-                tbl += 1
-                if block.miner_id == attacker_1:
-                    atb1 += 1
-                if block.miner_id == attacker_2:
-                    atb2 += 1
-            longest_chain = current_chain
+    # MPU metrics from node 0's view, as the parameter sweep records them
+    metrics = simulator.mpu_metrics()
 
-    print(f"length of longest chain: {len(longest_chain)}")
-    print(f"length of attacker 1 blocks: {atb1}", "MPU1(adv): ", atb1/tbl)
-    print(f"length of attacker 2 blocks: {atb2}", "MPU2(adv): ", atb2/tbl)
-    print(f"length of total blocks: {tb}", "MPU(total): ", tbl/tb)
+    print(f"length of longest chain: {metrics['longest_chain']}")
+    print(f"length of attacker 1 blocks: {metrics['attacker1_blocks']}", "MPU1(adv): ", metrics["mpu1"])
+    print(f"length of attacker 2 blocks: {metrics['attacker2_blocks']}", "MPU2(adv): ", metrics["mpu2"])
+    print(f"length of total blocks: {metrics['total_blocks']}", "MPU(total): ", metrics["mpu_total"])
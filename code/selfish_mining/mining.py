@@ -0,0 +1,137 @@
+import heapq
+
+from event import MINE_NEXT_BLOCK
+
+POWER_UNITS = 1 << 40  # Integer units of hashing power, so sums of eligible powers are exact
+MIN_COMPACTION = 64  # Superseded clock events tolerated before the event queue is compacted
+
+
+class FenwickTree:
+    def __init__(self, size):
+        """
+        Initialize a FenwickTree object (binary indexed tree) holding 'size' zeros.
+
+        Point updates and searches by prefix sum both take O(log size).
+
+        Parameters:
+        - size: Number of values.
+        """
+        self.tree = [0] * (size + 1)
+        self.total = 0
+
+    def add(self, index, delta):
+        """Add delta to the value at index."""
+        self.total += delta
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def find(self, target):
+        """Return the first index whose prefix sum exceeds target, for 0 <= target < total."""
+        position = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            if position + step < len(self.tree) and self.tree[position + step] <= target:
+                position += step
+                target -= self.tree[position]
+            step >>= 1
+        return position
+
+
+class MiningScheduler:
+    def __init__(self, simulator, hashing_powers, block_interval):
+        """
+        Initialize a MiningScheduler object.
+
+        Block production is a superposition of per-miner Poisson processes,
+        so it is driven by a single exponential clock whose rate is the total
+        hashing power of the eligible miners. When it fires, the winner is
+        drawn by hashing power among the eligible miners from a Fenwick tree.
+        Exponential gaps are memoryless, so when the eligible power changes
+        the remaining time of the clock is rescaled instead of redrawn.
+
+        Parameters:
+        - simulator: Reference to the simulator object.
+        - hashing_powers: Hashing power of each node, summing to 1.
+        - block_interval: Mean time between blocks when every miner is eligible.
+        """
+        self.simulator = simulator
+        self.weights = [round(power * POWER_UNITS) for power in hashing_powers]
+        self.block_interval = block_interval
+        self.rng = simulator.rng.mining
+        self.eligible = [False] * len(self.weights)
+        self.eligible_weights = FenwickTree(len(self.weights))
+        self.deadline = None  # Time of the next block, None while no miner is eligible
+        self.queued = []  # Heap of the times of the pending MINE_NEXT_BLOCK events
+
+    @property
+    def eligible_power(self):
+        """Total hashing power of the miners able to mine."""
+        return self.eligible_weights.total / POWER_UNITS
+
+    def set_eligible(self, node_id, eligible, time):
+        """Mark a node as able or unable to mine, adjusting the clock if that changes the rate."""
+        weight = self.weights[node_id]
+        if self.eligible[node_id] == eligible or weight <= 0:
+            return
+        previous_total = self.eligible_weights.total
+        self.eligible[node_id] = eligible
+        self.eligible_weights.add(node_id, weight if eligible else -weight)
+        total = self.eligible_weights.total
+        if total == 0:
+            self.deadline = None
+        elif self.deadline is None:
+            self.start(time)
+        else:
+            # The rescaled remainder of an exponential gap is a fresh gap at the new rate
+            self.deadline = time + (self.deadline - time) * previous_total / total
+            self.queue_deadline()
+
+    def start(self, time):
+        """Draw the time of the next block from `time`, if any miner is eligible."""
+        total = self.eligible_weights.total
+        if total == 0:
+            return
+        self.deadline = time + self.rng.exponential(
+            self.block_interval * POWER_UNITS / total
+        )
+        self.queue_deadline()
+
+    def queue_deadline(self):
+        """
+        Make sure an event fires at the deadline.
+
+        A later deadline is reached through the earlier event, which re-queues
+        it when it fires, so only a deadline that moved earlier is pushed.
+        """
+        if self.queued and self.queued[0] <= self.deadline:
+            return
+        queue = self.simulator.priority_queue
+        if len(self.queued) >= max(MIN_COMPACTION, len(queue) // 4):
+            # Drop the superseded events, amortized O(1) per push
+            queue.remove_if(lambda event: event[2] == MINE_NEXT_BLOCK)
+            self.queued = []
+        heapq.heappush(self.queued, self.deadline)
+        queue.push(self.deadline, MINE_NEXT_BLOCK, 0, (self.deadline,))
+
+    def mine_next_block(self, time):
+        """
+        Let a randomly chosen eligible miner mine a block.
+
+        Parameters:
+        - time: Time at which the block is mined.
+        """
+        heapq.heappop(self.queued)
+        if self.deadline != time:
+            # Superseded, the clock was rescaled after this event was queued
+            if self.deadline is not None and (not self.queued or self.queued[0] > self.deadline):
+                self.queue_deadline()
+            return
+        winner = self.eligible_weights.find(
+            self.rng.integers(0, self.eligible_weights.total)
+        )
+        self.deadline = None
+        self.simulator.nodes[winner].mine_block(time)
+        if self.deadline is None:
+            self.start(time)
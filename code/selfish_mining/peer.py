@@ -1,7 +1,17 @@
-from blockchain import Blockchain, Block
-import numpy as np, random
+import itertools
+from collections import deque
+from operator import itemgetter
+from blockchain import BlockDAG, Blockchain, Block
+from ledger import Ledger
+from mempool import Mempool
 from transaction import Transaction
-from event import Event
+from event import (
+    CONDITIONAL_MINE_BLOCK,
+    MINE_BLOCK,
+    PROPAGATE_BLOCK,
+    RECEIVE_BLOCK,
+    RECEIVE_TRANSACTION,
+)
 
 
 class Node:
@@ -14,6 +24,11 @@ class Node:
         selfish=False,
         simulator=None,
         hashing_power=0,
+        mempool_capacity=None,
+        mempool_eviction="oldest",
+        max_transactions_per_block=None,
+        block_id_mode="counter",
+        dag=None,
     ):
         """
         Initialize a Node object.
@@ -24,22 +39,34 @@ class Node:
         - CPU_speed: CPU speed of the node.
         - min_transactions_per_mining: Minimum number of transactions required to mine a block.
         - simulator: Reference to the simulator object.
+        - mempool_capacity: Maximum number of pending transactions, or None for no limit.
+        - mempool_eviction: Pending transaction dropped when the pool is full ("oldest" or "lowest_amount").
+        - max_transactions_per_block: Maximum number of pool transactions put in a mined block.
+        - block_id_mode: Block ID strategy of the node's blockchain ("counter" or "hash").
+        - dag: Shared BlockDAG holding the network's blocks, or None for a private one.
         """
         self.id = id
         self.speed = speed
         self.CPU_speed = CPU_speed
-        self.blockchain = Blockchain()
-        self.transaction_pool = []
+        self.blockchain = Blockchain(dag if dag is not None else BlockDAG(block_id_mode))
+        self.ledger = Ledger(self.blockchain)
+        self.transaction_pool = Mempool(mempool_capacity, mempool_eviction)
+        self.max_transactions_per_block = max_transactions_per_block
         self.peers = []
+        self.links = []  # (peer ID, latency, inverse link speed, known blocks) per connected peer
+        self.known_by_peer = {}  # Peer ID -> IDs of blocks sent to or received from that peer
         self.min_transactions_per_mining = min_transactions_per_mining
         self.simulator = simulator
         self.blocks_received = 0
         self.time_for_avg = 0
         self.avg_time = 0
+        self.mining_generation = 0  # Bumped when the pending mine_block event is replaced
+        self.mining_scheduled = False
+        self.conditional_generation = 0  # Bumped when the pending conditional_mine_block event is replaced
         self.selfish = selfish
         self.hashing_power = hashing_power
-        self.pchain = []
-        self.mine_block_id = 0
+        self.pchain = deque()  # Private chain, oldest block first
+        self.mine_block_id = None
 
     def __eq__(self, other):
         """Check equality between nodes based on their IDs."""
@@ -49,124 +76,126 @@ class Node:
         """Add a peer to the list of connected peers."""
         self.peers.append(peer)
 
+    def set_links(self, peer_ids, latencies, inverse_speeds):
+        """
+        Precompute the outgoing link table used when propagating blocks.
+
+        Parameters:
+        - peer_ids: IDs of the connected nodes.
+        - latencies: Latency of the link to each of them.
+        - inverse_speeds: Inverse speed of the link to each of them.
+        """
+        self.known_by_peer = {peer_id: set() for peer_id in peer_ids}
+        self.links = [
+            (peer_id, latency, inverse_speed, self.known_by_peer[peer_id])
+            for peer_id, latency, inverse_speed in zip(peer_ids, latencies, inverse_speeds)
+        ]
+
     def check_if_exists_in_blockchain(self, block):
         """Check if a block exists in the node's blockchain."""
-        for b in self.blockchain.blocks:
-            if b == block:
-                return True
-        return False
+        return self.blockchain.contains(block)
 
-    def receive_block(self, block, time):
+    def receive_block(self, block, time, sender=None):
         """
         Receive a block from a peer.
 
         Parameters:
         - block: Block received from the peer.
         - time: Time at which the block is received.
+        - sender: ID of the peer that sent the block, None if unknown.
         """
         self.time_for_avg += time
         self.blocks_received += 1
         self.avg_time = self.time_for_avg / self.blocks_received
-        if self.validate_block(block) and not self.check_if_exists_in_blockchain(block):
+        if sender is not None:
+            self.known_by_peer[sender].add(block.block_id)
+        # The cheap existence check goes first so duplicates skip validation
+        if not self.check_if_exists_in_blockchain(block) and self.validate_block(block):
             if self.selfish:
-                if len(self.pchain) > 0:
+                if self.pchain:
                     self.mine_block_id = self.pchain[-1].block_id
-                lead = (
-                    len(self.pchain)
-                    + len(
-                        self.blockchain.get_longest_chain(
-                            end_block=self.pchain[0]
-                        ))
-                    if len(self.pchain) > 0
-                    else 1
-                    - len(self.blockchain.get_longest_chain())
-                )
+                lead = self.lead()
                 self.blockchain.add_block(block)
-                lead_new = (
-                    len(self.pchain)
-                    + len(
-                        self.blockchain.get_longest_chain(
-                            self.pchain[0]
-                        ))
-                    if len(self.pchain) > 0
-                    else 1
-                    - len(self.blockchain.get_longest_chain())
-                )
+                lead_new = self.lead()
                 if lead == 1:
                     if lead_new == 0:
-                        self.blockchain.add_block(self.pchain[0])
+                        released = self.pchain.popleft()
+                        self.blockchain.add_block(released)
                         self.simulator.priority_queue.push(
-                            Event(
-                                self,
-                                "propagate_block",
-                                {"block": self.pchain[0], "time": time},
-                                time,
-                            )
+                            time, PROPAGATE_BLOCK, self.id, (released, time)
                         )
-                        temp = self.pchain[0].block_id
-                        self.pchain = self.pchain[1:]
-                        if(len(self.pchain) > 0):
+                        if self.pchain:
                             self.mine_block_id = self.pchain[-1].block_id
                         else:
-                            self.mine_block_id = temp
+                            self.mine_block_id = released.block_id
                 elif lead == 2:
                     if lead_new == 1:
-                        [
-                            self.simulator.priority_queue.push(
-                                Event(
-                                    self,
-                                    "propagate_block",
-                                    {"block": block, "time": time},
-                                    time,
-                                )
-                            )
-                            for block in self.pchain
-                        ]
-                        temp = self.pchain[0].block_id
-                        self.pchain = self.pchain[1:]
-                        if len(self.pchain) > 0:
-                            self.mine_block_id = self.pchain[-1].block_id
-                        else:
-                            self.mine_block_id = temp
-                        self.pchain = []
+                        self.release_private_blocks(len(self.pchain), time)
+                        self.mine_block_id = self.pchain[-1].block_id
+                        self.pchain.clear()
 
                 elif lead >= 2:
                     if lead_new == lead-1:
                         num = len(self.pchain) - lead_new
-                        [
-                            self.simulator.priority_queue.push(
-                                Event(
-                                    self,
-                                    "propagate_block",
-                                    {"block": block, "time": time},
-                                    time,
-                                )
-                            )
-                            for block in self.pchain[:num]
-                        ]
-                        temp = self.pchain[0].block_id
-                        self.pchain = self.pchain[1:]
-                        if len(self.pchain) > 0:
-                            self.mine_block_id = self.pchain[-1].block_id
+                        length = len(self.pchain)
+                        # The list version released pchain[:num] and kept pchain[1:][num:];
+                        # num is usually negative, so both slices then count from the end
+                        if num >= 0:
+                            release = min(length, num)
+                            keep = max(0, length - 1 - num)
                         else:
-                            self.mine_block_id = temp
-                        self.pchain = self.pchain[num:]
+                            release = max(0, length + num)
+                            keep = min(length - 1, -num)
+                        self.release_private_blocks(release, time)
+                        self.mine_block_id = self.pchain[-1].block_id
+                        for _ in range(length - keep):
+                            self.pchain.popleft()
 
                 elif lead <= 0 or lead_new <= 0:
-                    self.mine_block_id = self.blockchain.get_longest_chain()[-1].block_id
+                    self.mine_block_id = self.blockchain.tip.block_id
 
-            for transaction in block.transactions:
-                (
-                    self.transaction_pool.remove(transaction)
-                    if transaction in self.transaction_pool
-                    else None
-                )
+            self.transaction_pool.remove_many(txn.txn_id for txn in block.transactions)
+            if self.simulator.mining_scheduler is not None:
+                self.update_mining_eligibility(time)
             if self.selfish:
                 return
 
             self.blockchain.add_block(block)
+            # Fast propagation already accounts for honest relays in its arrival times
+            if self.simulator.fast_propagation is None:
+                self.simulator.priority_queue.push(
+                    time, PROPAGATE_BLOCK, self.id, (block, time)
+                )
+
+    def lead(self):
+        """
+        Return the selfish strategy's lead.
+
+        The lead is the private chain length plus the public chain length at
+        its first block, or one minus the public chain length without a private
+        chain. Heights come from the block DAG, so this is O(1) unless the fork
+        base of the private chain has not been received, in which case it falls
+        back to the walk of chain_length.
+        """
+        if not self.pchain:
+            return -self.blockchain.tip.height
+        first = self.pchain[0]
+        fork_base = first.jumps[0]
+        if self.blockchain.is_connected(first) or self.blockchain.is_connected(fork_base):
+            return len(self.pchain) + first.height + 1
+        return len(self.pchain) + self.blockchain.chain_length(first)
+
+    def release_private_blocks(self, count, time):
+        """
+        Propagate the first blocks of the private chain without removing them.
+
+        Parameters:
+        - count: Number of blocks to release.
+        - time: Time at which the blocks are propagated.
+        """
+        for block in itertools.islice(self.pchain, count):
             self.simulator.priority_queue.push(
-                Event(self, "propagate_block", {"block": block, "time": time}, time)
+                time, PROPAGATE_BLOCK, self.id, (block, time)
             )
 
     def receive_transaction(self, transaction, time):
@@ -177,13 +206,29 @@ class Node:
         - transaction: Transaction received from the peer.
         - time: Time at which the transaction is received.
         """
-        found = False
-        for block in self.blockchain.blocks:
-            if transaction in block.transactions:
-                found = True
-                break
-        if not found:
-            self.transaction_pool.append(transaction)
+        if not self.blockchain.has_transaction(transaction.txn_id):
+            self.transaction_pool.add(transaction)
+        self.check_mining_threshold(time)
+
+    def receive_transactions(self, transactions, time):
+        """
+        Receive a batch of transactions from peers.
+
+        Parameters:
+        - transactions: Transactions received from the peers.
+        - time: Time at which the batch is received.
+        """
+        has_transaction = self.blockchain.has_transaction
+        self.transaction_pool.add_many(
+            [txn for txn in transactions if not has_transaction(txn.txn_id)]
+        )
+        self.check_mining_threshold(time)
+
+    def check_mining_threshold(self, time):
+        """Start mining if the transaction pool has grown large enough."""
+        if self.simulator.mining_scheduler is not None:
+            self.update_mining_eligibility(time)
+            return
 
         # Automatically mine a block when the transaction pool reaches a size of 2
         time += 1
@@ -194,141 +239,150 @@ class Node:
         )
         if len(self.transaction_pool) >= self.min_transactions_per_mining:
             # self.mine_block(time)
-            if self.hashing_power > 0:
-                self.simulator.priority_queue.push(
-                    Event(
-                        self,
-                        "mine_block",
-                        {
-                            "time": time,
-                        },
-                        timestamp,
-                    )
-                )
+            if self.hashing_power > 0 and not self.mining_scheduled:
+                self.schedule_mining(timestamp, time)
 
-    def mine_block(self, time):
+    def schedule_mining(self, timestamp, time):
+        """
+        Schedule the node's mine_block event, replacing any pending one.
+
+        Parameters:
+        - timestamp: Simulation time of the event.
+        - time: Time passed to mine_block.
+        """
+        self.mining_generation += 1
+        self.mining_scheduled = True
+        self.simulator.priority_queue.push(
+            timestamp, MINE_BLOCK, self.id, (time, self.mining_generation, timestamp)
+        )
+
+    def update_mining_eligibility(self, time):
+        """Tell the global mining scheduler whether the pool is large enough to mine."""
+        self.simulator.mining_scheduler.set_eligible(
+            self.id,
+            len(self.transaction_pool) >= self.min_transactions_per_mining,
+            time,
+        )
+
+    def mine_block(self, time, generation=None, event_time=None):
         """
         Mine a block with transactions from the transaction pool.
 
         Parameters:
         - time: Time at which the block is mined.
+        - generation: Mining generation of the event, stale events are ignored.
+        - event_time: Simulation time of the event when it differs from time, as
+          for the events of schedule_mining. The block is propagated from then.
         """
-
-        self.transaction_pool.append(
-            Transaction(-1, self.id, 50, timestamp=time*(1/self.hashing_power)) if self.hashing_power > 0 
-            else Transaction(-1, self.id, 50, timestamp=time)
+        if generation is not None:
+            if generation != self.mining_generation:
+                return None
+            self.mining_scheduled = False
+        if event_time is None:
+            event_time = time
+
+        transactions = self.transaction_pool.take(self.max_transactions_per_block)
+        if self.simulator.mining_scheduler is not None:
+            self.update_mining_eligibility(time)
+        transactions.append(
+            Transaction(-1, self.id, 50, timestamp=time*(1/self.hashing_power), txn_id=self.simulator.new_transaction_id()) if self.hashing_power > 0 
+            else Transaction(-1, self.id, 50, timestamp=time, txn_id=self.simulator.new_transaction_id())
         )  
 
         if self.selfish:
             # print(self.id, self.mine_block_id, len(self.pchain), self.pchain[-1].block_id if len(self.pchain) > 0 else None)
             if(len(self.pchain) != 0):
                 self.mine_block_id = self.pchain[-1].block_id
-            new_block = self.blockchain.create_block(self.transaction_pool, self, self.mine_block_id, self.id)
+            new_block = self.blockchain.create_block(transactions, self, self.mine_block_id, self.id)
             self.pchain.append(new_block)
-            self.transaction_pool = []
             self.simulator.priority_queue.push(
-                Event(
-                    self,
-                    "propagate_block",
-                    {
-                        "block": new_block,
-                        "time": time,
-                    },
-                    time,
-                )
-            )  # Clear the transaction pool
+                event_time, PROPAGATE_BLOCK, self.id, (new_block, event_time)
+            )
             return None
 
-        new_block = self.blockchain.create_block(self.transaction_pool, self, miner_id=self.id)
-        self.simulator.longest_chains[self.simulator.nodes.index(self)] = (
-            self.blockchain.get_longest_chain()
-        )
+        new_block = self.blockchain.create_block(transactions, self, miner_id=self.id)
+        self.simulator.longest_chains[self.id] = self.blockchain.tip
         self.simulator.priority_queue.push(
-            Event(
-                self,
-                "propagate_block",
-                {
-                    "block": new_block,
-                    "time": time,
-                },
-                time,
-            )
+            event_time, PROPAGATE_BLOCK, self.id, (new_block, event_time)
         )
-        self.transaction_pool = []  # Clear the transaction pool
         return new_block
 
-    def conditional_mine_block(self, prev_longest_chain, time):
+    def schedule_conditional_mining(self, prev_tip, prev_version, time):
+        """
+        Schedule the node's conditional_mine_block event, replacing any pending one.
+
+        Parameters:
+        - prev_tip: Tip of the longest chain when the event is scheduled.
+        - prev_version: Chain version of the blockchain when the event is scheduled.
+        - time: Time at which the event occurs.
+        """
+        self.conditional_generation += 1
+        self.simulator.priority_queue.push(
+            time,
+            CONDITIONAL_MINE_BLOCK,
+            self.id,
+            (prev_tip, prev_version, time, self.conditional_generation),
+        )
+
+    def conditional_mine_block(self, prev_tip, prev_version, time, generation=None):
         """
         Mine a block conditionally based on the longest chain.
 
         Parameters:
-        - prev_longest_chain: Previous longest chain.
+        - prev_tip: Previous tip of the longest chain.
+        - prev_version: Chain version of the blockchain when prev_tip was the tip.
         - time: Time at which the block is mined.
+        - generation: Generation of the event, stale events are ignored.
         """
+        if generation is not None and generation != self.conditional_generation:
+            return
+        # An unchanged version means an unchanged tip, which cannot extend itself
+        if prev_version == self.blockchain.version:
+            return
         timestamp = time*(1/self.hashing_power) if self.hashing_power > 0 else time * 1e12
-        if self.simulator.is_proper_prefix(
-            prev_longest_chain, self.blockchain.get_longest_chain()
+        tip = self.blockchain.tip
+        if (
+            self.blockchain.is_connected(prev_tip)
+            and prev_tip.height < tip.height
+            and self.blockchain.is_ancestor(prev_tip, tip)
         ):
             if self.hashing_power > 0:
-                self.simulator.priority_queue.push(
-                    Event(
-                        self,
-                        "mine_block",
-                        {
-                            "time": time,
-                        },
-                        timestamp,
-                    )
-                )
+                self.schedule_mining(timestamp, time)
 
     def propagate_block(self, block, time):
         """
-        Propagate a mined block to other nodes in the network.
+        Propagate a block to the connected nodes that do not have it yet.
 
         Parameters:
         - block: Block to be propagated.
         - time: Time at which the block is propagated.
         """
-        for peer in self.peers:
-            self.simulator.priority_queue.push(
-                Event(
-                    peer,
-                    "receive_block",
-                    {
-                        "block": block,
-                        "time": time
-                        + self.simulator.get_latency(
-                            self.id, peer.node.id, messg_size=len(block.transactions)
-                        ),
-                    },
-                    time
-                    + self.simulator.get_latency(
-                        self.id, peer.node.id, messg_size=len(block.transactions)
-                    ),
-                )
-            )
+        if self.simulator.fast_propagation is not None:
+            self.simulator.fast_propagation.propagate(self.id, block, time)
+            return
+        size = len(block.transactions)
+        block_id = block.block_id
+        deliveries = []
+        for peer_id, latency, inverse_speed, known in self.links:
+            # Send each block at most once per link, and never back to its sender
+            if block_id in known:
+                continue
+            known.add(block_id)
+            arrival = time + latency + size * inverse_speed
+            deliveries.append((arrival, peer_id, (block, arrival, self.id)))
+        # One queue entry walks the receivers in arrival order
+        deliveries.sort(key=itemgetter(0))
+        self.simulator.push_multicast(RECEIVE_BLOCK, deliveries)
 
     def validate_block(self, block):
         """Validate a received block before adding it to the blockchain."""
-        # Check if sender has sufficient balance
-        for transaction in block.transactions:
-            if transaction.sender != -1:
-                sender_balance = self.get_balance(transaction.sender)
-                if sender_balance < transaction.amount:
-                    return False
-        # For simplicity, assume all blocks are valid in this implementation
-        return True
+        # Check if senders have sufficient balance on the block's own branch
+        return self.ledger.validate(block)
 
     def get_balance(self, account_id):
-        """Get the balance of an account from the blockchain."""
-        balance = 1200000
-        for b in self.blockchain.blocks:
-            for txn in b.transactions:
-                if txn.sender == account_id:
-                    balance -= txn.amount
-                if txn.receiver == account_id:
-                    balance += txn.amount
-        return balance
+        """Get the balance of an account on the longest chain."""
+        self.ledger.move_to(self.blockchain.tip)
+        return self.ledger.balance(account_id)
 
 
 class Peer:
@@ -343,7 +397,6 @@ class Peer:
         """
         self.node = node
         self.connections = []
-        self.rel_transaction_timestamp = 0
         self.n = n
         self.simulator = simulator
 
@@ -355,49 +408,16 @@ class Peer:
         """Establish a connection to another peer."""
         self.connections.append(peer)
 
-    def generate_transactions(self, time):
-        """
-        Generate and broadcast a new transaction.
-
-        Parameters:
-        - time: Time at which the transaction is generated.
-        """
-        sender = self.node.id
-        nodes = [i for i in range(self.n) if i != sender]
-        receiver = random.choice(nodes)
-        amount = random.randint(1, 50)
-        transaction = Transaction(
-            sender, receiver, amount, self.rel_transaction_timestamp
-        )
-        self.rel_transaction_timestamp += np.random.exponential(
-            self.simulator.transaction_mean_gap
-        )
-        self.simulator.priority_queue.push(
-            Event(
-                self,
-                "generate_transactions",
-                {"time": self.rel_transaction_timestamp},
-                self.rel_transaction_timestamp,
-            )
-        )
-        self.simulator.priority_queue.push(
-            Event(
-                self,
-                "broadcast_transaction",
-                {"transaction": transaction, "time": self.rel_transaction_timestamp},
-                self.rel_transaction_timestamp,
-            )
-        )
-
-    def receive_block(self, block, time):
+    def receive_block(self, block, time, sender=None):
         """
         Receive a block from a peer.
 
         Parameters:
         - block: Block received from the peer.
         - time: Time at which the block is received.
+        - sender: ID of the peer that sent the block, None if unknown.
         """
-        self.node.receive_block(block, time)
+        self.node.receive_block(block, time, sender)
 
     def receive_transaction(self, transaction, time):
         """
@@ -409,6 +429,16 @@ class Peer:
         """
         self.node.receive_transaction(transaction, time)
 
+    def receive_transactions(self, transactions, time):
+        """
+        Receive a batch of transactions from peers.
+
+        Parameters:
+        - transactions: Transactions received from the peers.
+        - time: Time at which the batch is received.
+        """
+        self.node.receive_transactions(transactions, time)
+
     def mine_block(self):
         """Mine a new block using the associated node's mining function."""
         new_block = self.node.mine_block()
@@ -425,10 +455,8 @@ class Peer:
         """
         if self.node.selfish:
             return
-        for peer in self.connections:
-            self.simulator.priority_queue.push(
-                Event(peer, "receive_block", {"block": block, "time": time}, time)
-            )
+        # Relay through the node so its per-link filters apply
+        self.node.propagate_block(block, time)
 
     def broadcast_transaction(self, transaction, time):
         """
@@ -438,12 +466,11 @@ class Peer:
         - transaction: Transaction to be broadcasted.
         - time: Time at which the transaction is broadcasted.
         """
-        for peer in self.connections:
-            self.simulator.priority_queue.push(
-                Event(
-                    peer,
-                    "receive_transaction",
-                    {"transaction": transaction, "time": time},
-                    time,
-                )
-            )
+        if self.simulator.transaction_batch_quantum is not None:
+            for peer in self.connections:
+                self.simulator.batch_transaction(peer.node.id, transaction, time)
+            return
+        self.simulator.push_multicast(
+            RECEIVE_TRANSACTION,
+            [(time, peer.node.id, (transaction, time)) for peer in self.connections],
+        )
@@ -0,0 +1,94 @@
+import numpy as np
+
+STREAMS = ("topology", "latency", "transactions", "mining")
+
+
+class RandomStream:
+    def __init__(self, generator, block_size=4096):
+        """
+        Initialize a RandomStream object.
+
+        Scalar draws are served from blocks of standard uniforms and
+        exponentials drawn ahead of time, so hot paths pop from a list instead
+        of calling NumPy once per value. Array draws go to the generator.
+
+        Parameters:
+        - generator: numpy.random.Generator backing the stream.
+        - block_size: Number of values drawn per block.
+        """
+        self.generator = generator
+        self.block_size = block_size
+        self._uniforms = []
+        self._exponentials = []
+
+    def random(self):
+        """Return a uniform float in [0, 1)."""
+        if not self._uniforms:
+            self._uniforms = self.generator.random(self.block_size).tolist()
+        return self._uniforms.pop()
+
+    def uniform(self, low, high):
+        """Return a uniform float in [low, high)."""
+        return low + (high - low) * self.random()
+
+    def exponential(self, scale):
+        """Return an exponential float with the given mean."""
+        if not self._exponentials:
+            self._exponentials = self.generator.standard_exponential(
+                self.block_size
+            ).tolist()
+        return scale * self._exponentials.pop()
+
+    def integers(self, low, high):
+        """Return a uniform integer in [low, high)."""
+        return low + int(self.random() * (high - low))
+
+    def choice(self, sequence):
+        """Return a uniformly chosen element of a sequence."""
+        return sequence[self.integers(0, len(sequence))]
+
+    def shuffle(self, array):
+        """Shuffle a list in place."""
+        self.generator.shuffle(array)
+
+
+class RandomService:
+    def __init__(self, seed=None, block_size=4096):
+        """
+        Initialize a RandomService object.
+
+        One independent, buffered stream per purpose is spawned from a single
+        SeedSequence, so a seed reproduces a whole run and adding draws to one
+        purpose does not shift the values seen by the others.
+
+        Parameters:
+        - seed: Seed of the run, or None for fresh OS entropy.
+        - block_size: Number of values each stream draws ahead.
+        """
+        self.seed_sequence = np.random.SeedSequence(seed)
+        children = self.seed_sequence.spawn(len(STREAMS) + 1)
+        for name, child in zip(STREAMS, children):
+            setattr(self, name, RandomStream(np.random.default_rng(child), block_size))
+        self._node_root = children[-1]
+        self._node_streams = {}
+
+    def node_stream(self, node_id, block_size=64):
+        """
+        Return the stream of one node, created the first time it is asked for.
+
+        A node's draws come from its own stream, so they do not depend on the
+        order in which nodes are served, as in a partitioned run.
+
+        Parameters:
+        - node_id: ID of the node.
+        - block_size: Number of values the stream draws ahead.
+        """
+        stream = self._node_streams.get(node_id)
+        if stream is None:
+            # Same seed as the node_id-th child that _node_root.spawn() would return
+            child = np.random.SeedSequence(
+                self._node_root.entropy, spawn_key=self._node_root.spawn_key + (node_id,)
+            )
+            stream = RandomStream(np.random.default_rng(child), block_size)
+            self._node_streams[node_id] = stream
+        return stream
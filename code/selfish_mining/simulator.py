@@ -1,10 +1,34 @@
+from bisect import bisect_left
+from blockchain import BlockDAG
 from graph import generate_connected_graph
-import heapq, random
+import heapq
+import itertools
 import numpy as np
 from peer import Peer, Node
-from event import Event, EventPriorityQueue
+from propagation import FastPropagation
+from mining import MiningScheduler
+from rng import RandomService
+from transaction_source import TransactionSource
+from event import (
+    BROADCAST_TRANSACTION,
+    CONDITIONAL_MINE_BLOCK,
+    GENERATE_TRANSACTIONS,
+    HANDLER_NAMES,
+    MINE_BLOCK,
+    MINE_NEXT_BLOCK,
+    MULTICAST,
+    PROPAGATE_BLOCK,
+    RECEIVE_BLOCK,
+    RECEIVE_TRANSACTION,
+    RECEIVE_TRANSACTIONS,
+    CalendarQueue,
+    EventPriorityQueue,
+)
 from utils import generate_distinct_random_numbers
 
+MIN_LINK_LATENCY = 10
+MAX_LINK_LATENCY = 500
+
 
 class Simulator:
     def __init__(
@@ -17,6 +41,16 @@ class Simulator:
         max_events=100,
         attacker_hash1=0,
         attacker_hash2=0,
+        mempool_capacity=None,
+        mempool_eviction="oldest",
+        max_transactions_per_block=None,
+        block_id_mode="counter",
+        scheduler="heap",
+        block_interval=None,
+        seed=None,
+        propagation="hop",
+        transaction_batch_quantum=None,
+        transaction_ids=None,
     ):
         """
         Initialize a Simulator object.
@@ -28,19 +62,47 @@ class Simulator:
         - min_transactions_per_mining: Minimum number of transactions required to mine a block.
         - transaction_mean_gap: Mean time gap between transactions.
         - max_events: Maximum number of events to simulate.
+        - attacker_hash1: Hashing power of the first selfish miner.
+        - attacker_hash2: Hashing power of the second selfish miner.
+        - mempool_capacity: Maximum number of pending transactions per node, or None for no limit.
+        - mempool_eviction: Pending transaction dropped when a pool is full ("oldest" or "lowest_amount").
+        - max_transactions_per_block: Maximum number of pool transactions in a mined block, or None for all.
+        - block_id_mode: "counter" for sequential block IDs, or "hash" for Merkle-rooted SHA-256 IDs.
+        - scheduler: Event queue backend, "heap" for a binary heap or "calendar" for a calendar queue.
+        - block_interval: Mean time between blocks. When given, a single global mining clock
+          replaces the per-node mining events.
+        - seed: Seed of all random streams, None for a non-reproducible run.
+        - propagation: "hop" to relay blocks link by link, or "fast" to compute every
+          arrival of a block with one shortest-path pass from its sender.
+        - transaction_batch_quantum: Length of the time windows whose transactions are
+          delivered to each peer as one batch at the window's end, None to deliver
+          every transaction on its own.
+        - transaction_ids: Iterator of the IDs given to new transactions, coinbase ones
+          included, None to number them from 0 within this simulator.
         """
+        self.rng = RandomService(seed)
         self.peers = []
         self.nodes = []
         self.min_transactions_per_mining = min_transactions_per_mining
         self.transaction_mean_gap = transaction_mean_gap
-        self.graph = generate_connected_graph(n)
+        if mempool_capacity is not None and mempool_capacity < min_transactions_per_mining:
+            raise ValueError(
+                f"Mempool capacity {mempool_capacity} is below the mining threshold "
+                f"of {min_transactions_per_mining} transactions, so no node could mine"
+            )
+        self.mempool_capacity = mempool_capacity
+        self.mempool_eviction = mempool_eviction
+        self.max_transactions_per_block = max_transactions_per_block
+        self.block_id_mode = block_id_mode
+        self.dag = BlockDAG(block_id_mode)  # Every block is stored once, shared by all nodes
+        self.graph = generate_connected_graph(n, self.rng.topology)
         speeds = self.generate_array_random(n, z0)
         CPU_speeds = self.generate_array_random(n, z1)
         self.h = 1 / (n + 9 * sum(CPU_speeds))
         self.attacker_hash1 = attacker_hash1
         self.attacker_hash2 = attacker_hash2
 
-        att1, att2 = generate_distinct_random_numbers(n)
+        att1, att2 = generate_distinct_random_numbers(n, self.rng.topology)
         self.att1, self.att2 = att1, att2
         # Initialize nodes and peers
         print("attacker nodes: ", att1, ", ", att2)
@@ -55,6 +117,10 @@ class Simulator:
                     simulator=self,
                     selfish=True,
                     hashing_power=self.attacker_hash1,
+                    mempool_capacity=self.mempool_capacity,
+                    mempool_eviction=self.mempool_eviction,
+                    max_transactions_per_block=self.max_transactions_per_block,
+                    dag=self.dag,
                 )
             elif i == att2:
                 node = Node(
@@ -65,6 +131,10 @@ class Simulator:
                     simulator=self,
                     selfish=True,
                     hashing_power=self.attacker_hash2,
+                    mempool_capacity=self.mempool_capacity,
+                    mempool_eviction=self.mempool_eviction,
+                    max_transactions_per_block=self.max_transactions_per_block,
+                    dag=self.dag,
                 )
             else:
                 node = Node(
@@ -76,6 +146,10 @@ class Simulator:
                     selfish=False,
                     hashing_power=(1 - (self.attacker_hash1 + self.attacker_hash2))
                     / (n - 2),
+                    mempool_capacity=self.mempool_capacity,
+                    mempool_eviction=self.mempool_eviction,
+                    max_transactions_per_block=self.max_transactions_per_block,
+                    dag=self.dag,
                 )
             self.nodes.append(node)
             self.peers.append(Peer(node, n, self))
@@ -83,25 +157,88 @@ class Simulator:
         # Connect peers in the network
         self.connect_peers()
 
-        # Initialize latencies matrix
-        self.latencies = [[0 for _ in range(n)] for _ in range(n)]
-        self.longest_chains = [
-            node.blockchain.get_longest_chain() for node in self.nodes
-        ]
+        # Resolve event handlers once: handler ID -> (function, objects indexed by target ID)
+        self.handlers = [None] * len(HANDLER_NAMES)
+        self.transaction_batch_quantum = transaction_batch_quantum
+        self.transaction_batches = {}  # Peer ID -> (window end, transactions) of its open batch
+        self.transaction_ids = itertools.count() if transaction_ids is None else transaction_ids
+        self.transaction_source = TransactionSource(self, n, transaction_mean_gap)
+        self.handlers[GENERATE_TRANSACTIONS] = (
+            TransactionSource.generate_transaction,
+            [self.transaction_source],
+        )
+        self.handlers[BROADCAST_TRANSACTION] = (Peer.broadcast_transaction, self.peers)
+        self.handlers[RECEIVE_TRANSACTION] = (Peer.receive_transaction, self.peers)
+        self.handlers[RECEIVE_TRANSACTIONS] = (Peer.receive_transactions, self.peers)
+        self.handlers[RECEIVE_BLOCK] = (Peer.receive_block, self.peers)
+        self.handlers[PROPAGATE_BLOCK] = (Node.propagate_block, self.nodes)
+        self.handlers[MINE_BLOCK] = (Node.mine_block, self.nodes)
+        self.handlers[CONDITIONAL_MINE_BLOCK] = (Node.conditional_mine_block, self.nodes)
+        self.handlers[MULTICAST] = (Simulator.multicast, [self])
 
-        # Generate latencies matrix
-        for i in range(n):
-            for j in range(n):
-                if i != j:
-                    ij = np.random.uniform(10, 500)
-                    cij = 100 if (self.nodes[i].speed and self.nodes[j].speed) else 5
-                    dij = np.random.exponential(96 / cij)
-                    self.latencies[i][j] = ij + dij
-                else:
-                    self.latencies[i][j] = 0
+        # Tip of each node's longest chain
+        self.longest_chains = [node.blockchain.tip for node in self.nodes]
+
+        # Sample latencies only for the directed links of the graph, aligned with
+        # its CSR arrays, so memory grows with the number of edges rather than n^2
+        generator = self.rng.latency.generator
+        self.indptr, self.indices = self.graph.to_csr()
+        self.fast = np.array(speeds, dtype=bool)
+        sources = np.repeat(np.arange(n), np.diff(self.indptr))
+        self.link_speeds = np.where(
+            self.fast[sources] & self.fast[self.indices], 100.0, 5.0
+        )
+        self.latencies = generator.uniform(
+            MIN_LINK_LATENCY, MAX_LINK_LATENCY, len(self.indices)
+        ) + generator.exponential(96 / self.link_speeds)
+        # Lists index faster than arrays for the scalar lookups of get_latency
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._latencies = self.latencies.tolist()
+        self._inverse_speeds = (1 / self.link_speeds).tolist()
+        self._remote_latencies = {}  # (i, j) -> (latency, link speed) for non-neighbours
+        for node in self.nodes:
+            start, end = self._indptr[node.id], self._indptr[node.id + 1]
+            node.set_links(
+                self._indices[start:end],
+                self._latencies[start:end],
+                self._inverse_speeds[start:end],
+            )
 
         # Initialize priority queue and generate initial transactions
-        self.priority_queue = EventPriorityQueue()
+        if scheduler == "heap":
+            self.priority_queue = EventPriorityQueue()
+        elif scheduler == "calendar":
+            # Link latencies are at least MIN_LINK_LATENCY, a good first guess for
+            # the gap between events; the queue refines it as it resizes
+            self.priority_queue = CalendarQueue(bucket_width=MIN_LINK_LATENCY)
+        else:
+            raise ValueError(f"Unknown scheduler: {scheduler}")
+
+        # Drive block production from one global clock if a block interval is given
+        self.mining_scheduler = None
+        if block_interval is not None:
+            hashing_powers = [node.hashing_power for node in self.nodes]
+            self.mining_scheduler = MiningScheduler(self, hashing_powers, block_interval)
+            self.handlers[MINE_NEXT_BLOCK] = (
+                MiningScheduler.mine_next_block,
+                [self.mining_scheduler],
+            )
+
+        # Replace hop-by-hop block relay with one shortest-path pass per block
+        self.fast_propagation = None
+        if propagation == "fast":
+            self.fast_propagation = FastPropagation(
+                self,
+                self._indptr,
+                self._indices,
+                self._latencies,
+                self._inverse_speeds,
+                [not node.selfish for node in self.nodes],
+            )
+        elif propagation != "hop":
+            raise ValueError(f"Unknown propagation mode: {propagation}")
+        self.partition = None  # Set by a parallel worker to route deliveries to other workers
         self.generate_transactions_init()
         self.max_events = max_events
 
@@ -110,7 +247,7 @@ class Simulator:
         num_ones = int(n * z)
         num_zeros = n - num_ones
         array = [1] * num_ones + [0] * num_zeros
-        random.shuffle(array)
+        self.rng.topology.shuffle(array)
         return array
 
     def simulate(self):
@@ -118,78 +255,164 @@ class Simulator:
         for i in range(self.max_events):
             self.event_handler()
 
+    def simulate_until(self, end_time):
+        """Simulate the events that occur before end_time."""
+        queue = self.priority_queue
+        while not queue.is_empty() and queue.peek()[0] < end_time:
+            self.event_handler()
+
     def connect_peers(self):
         """Connect peers in the network based on the generated graph."""
-        for i, row in enumerate(self.graph):
-            for j, connected in enumerate(row):
-                if j <= i:
-                    continue
-                if connected:
-                    self.peers[i].connect_to_peer(self.peers[j])
-                    self.nodes[i].add_peer(self.peers[j])
-                    self.peers[j].connect_to_peer(self.peers[i])
-                    self.nodes[j].add_peer(self.peers[i])
+        for i, j in self.graph.edges:
+            self.peers[i].connect_to_peer(self.peers[j])
+            self.nodes[i].add_peer(self.peers[j])
+            self.peers[j].connect_to_peer(self.peers[i])
+            self.nodes[j].add_peer(self.peers[i])
 
     def generate_transactions_init(self):
-        """Generate initial transactions for all peers."""
-        for peer in self.peers:
-            event = Event(peer, "generate_transactions", {"time": 0}, 0)
-            self.priority_queue.push(event)
+        """Start generating transactions from the network-wide source."""
+        self.transaction_source.schedule_next()
+
+    def new_transaction_id(self):
+        """Return the ID of a new transaction."""
+        return next(self.transaction_ids)
 
     def get_latency(self, i, j, messg_size=1):
-        """Calculate the latency between two nodes."""
-        cij = 100 if (self.nodes[i].speed and self.nodes[j].speed) else 5
-        return self.latencies[i][j] + messg_size / cij
+        """
+        Calculate the latency between two nodes.
+
+        Neighbours are looked up in the per-edge arrays. Latencies of other
+        pairs are sampled the first time they are asked for and cached.
+        """
+        if i == j:
+            return 0
+        start, end = self._indptr[i], self._indptr[i + 1]
+        k = bisect_left(self._indices, j, start, end)
+        if k < end and self._indices[k] == j:
+            return self._latencies[k] + messg_size * self._inverse_speeds[k]
+        if (i, j) not in self._remote_latencies:
+            cij = 100 if (self.fast[i] and self.fast[j]) else 5
+            self._remote_latencies[(i, j)] = (
+                self.rng.latency.uniform(MIN_LINK_LATENCY, MAX_LINK_LATENCY)
+                + self.rng.latency.exponential(96 / cij),
+                cij,
+            )
+        latency, cij = self._remote_latencies[(i, j)]
+        return latency + messg_size / cij
 
     def event_handler(self):
         """Handle the events in the priority queue."""
         if not self.priority_queue.is_empty():
-            event = self.priority_queue.pop()
-            if event.function == "receive_block":
-                index = self.peers.index(event.object)
-                longest_chain_before = event.object.node.blockchain.get_longest_chain()
-                if hasattr(event.object, event.function):
-                    method = getattr(event.object, event.function)
-                    if event.params is not None:
-                        method(**event.params)
-                    else:
-                        method()
-                longest_chain_after = event.object.node.blockchain.get_longest_chain()
-                self.longest_chains[index] = longest_chain_after
-                Tk = np.random.exponential(
-                    self.nodes[index].avg_time / 10 * self.h
-                    if self.nodes[index].CPU_speed == 1
-                    else self.h
-                )
-                if longest_chain_before != longest_chain_after[:-1]:
-                    self.priority_queue.push(
-                        Event(
-                            self.nodes[index],
-                            "conditional_mine_block",
-                            {
-                                "prev_longest_chain": longest_chain_after,
-                                "time": event.time + Tk,
-                            },
-                            event.time + Tk,
-                        )
-                    )
-                    pass
-            else:
-                if hasattr(event.object, event.function):
-                    method = getattr(event.object, event.function)
-                    if event.params is not None:
-                        method(**event.params)
-                    else:
-                        method()
+            time, _, handler_id, target_id, payload = self.priority_queue.pop()
+            self.dispatch(time, handler_id, target_id, payload)
         else:
             print("Events are empty")
 
-    def is_proper_prefix(self, list1, list2):
-        """Check if list1 is a proper prefix of list2."""
-        if len(list1) < len(list2):
-            return all(list1[i] == list2[i] for i in range(len(list1)))
+    def dispatch(self, time, handler_id, target_id, payload):
+        """Run the handler of an event on its target."""
+        if handler_id == RECEIVE_BLOCK:
+            self.deliver_block(target_id, payload, time)
         else:
-            return False
+            method, targets = self.handlers[handler_id]
+            method(targets[target_id], *payload)
+
+    def push_multicast(self, handler_id, deliveries):
+        """
+        Schedule many events of one handler as a single queue entry.
+
+        Parameters:
+        - handler_id: Handler of every delivery.
+        - deliveries: (time, target ID, payload) of each delivery, sorted by time.
+        """
+        if self.partition is not None:
+            deliveries = self.partition.route(handler_id, deliveries)
+        if deliveries:
+            self.priority_queue.push(
+                deliveries[0][0], MULTICAST, 0, (handler_id, deliveries, 0)
+            )
+
+    def batch_transaction(self, target_id, transaction, time):
+        """
+        Add a transaction to the batch of a peer's current time window.
+
+        The first transaction of a window schedules the batch delivery at the
+        window's end, later ones join the same list.
+
+        Parameters:
+        - target_id: ID of the receiving peer.
+        - transaction: Transaction sent to the peer.
+        - time: Time at which the transaction is sent.
+        """
+        window_end = (time // self.transaction_batch_quantum + 1) * self.transaction_batch_quantum
+        batch = self.transaction_batches.get(target_id)
+        if batch is None or batch[0] != window_end:
+            batch = (window_end, [])
+            self.transaction_batches[target_id] = batch
+            self.priority_queue.push(
+                window_end, RECEIVE_TRANSACTIONS, target_id, (batch[1], window_end)
+            )
+        batch[1].append(transaction)
+
+    def multicast(self, handler_id, deliveries, position):
+        """
+        Make the next delivery of a multicast and re-insert it for the one after.
+
+        Parameters:
+        - handler_id: Handler of every delivery.
+        - deliveries: (time, target ID, payload) of each delivery, sorted by time.
+        - position: Index in deliveries of the delivery to make.
+        """
+        time, target_id, payload = deliveries[position]
+        if position + 1 < len(deliveries):
+            self.priority_queue.push(
+                deliveries[position + 1][0], MULTICAST, 0, (handler_id, deliveries, position + 1)
+            )
+        self.dispatch(time, handler_id, target_id, payload)
+
+    def deliver_block(self, target_id, payload, time):
+        """
+        Deliver a block to a peer and react if its longest chain changed.
+
+        Parameters:
+        - target_id: ID of the receiving peer.
+        - payload: Arguments of Peer.receive_block.
+        - time: Time of the delivery.
+        """
+        node = self.nodes[target_id]
+        tip_before = node.blockchain.tip
+        self.peers[target_id].receive_block(*payload)
+        tip_after = node.blockchain.tip
+        self.longest_chains[target_id] = tip_after
+        if self.mining_scheduler is not None:
+            return
+        Tk = self.rng.node_stream(target_id).exponential(
+            node.avg_time / 10 * self.h
+            if node.CPU_speed == 1
+            else self.h
+        )
+        # Chains run back to genesis, so the new chain is the old one plus
+        # a single block exactly when the new tip's parent is the old tip
+        if tip_after.previous_block_id != tip_before.block_id:
+            node.schedule_conditional_mining(
+                tip_after, node.blockchain.version, time + Tk
+            )
+
+    def mpu_metrics(self):
+        """Return node 0's longest chain and block counts and the MPU ratios they give."""
+        tb = len(self.nodes[0].blockchain.blocks)
+        longest_chain = self.nodes[0].blockchain.get_longest_chain()
+        tbl = len(longest_chain)
+        atb1 = sum(1 for block in longest_chain if block.miner_id == self.att1)
+        atb2 = sum(1 for block in longest_chain if block.miner_id == self.att2)
+        return {
+            "longest_chain": tbl,
+            "total_blocks": tb,
+            "attacker1_blocks": atb1,
+            "attacker2_blocks": atb2,
+            "mpu1": atb1 / tbl,
+            "mpu2": atb2 / tbl,
+            "mpu_total": tbl / tb,
+        }
 
     def print_blockchain(self):
         """Print the blockchain of each node to a file."""
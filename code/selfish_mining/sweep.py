@@ -0,0 +1,99 @@
+from simulator import Simulator
+import contextlib
+import csv
+import io
+import itertools
+import multiprocessing
+import sys
+
+# Grid parameters: command-line flag, Simulator argument, value type and default values
+GRID = (
+    ("--att1", "attacker_hash1", float, [0.0, 0.1, 0.3, 0.5]),
+    ("--att2", "attacker_hash2", float, [0.0]),
+    ("--peers", "n", int, [50]),
+    ("--z0", "z0", float, [0.5]),
+    ("--z1", "z1", float, [0.5]),
+    ("--transaction-mean-gap", "transaction_mean_gap", int, [10]),
+    ("--seeds", "seed", int, [0]),
+)
+
+METRICS = ("longest_chain", "total_blocks", "attacker1_blocks", "attacker2_blocks", "mpu1", "mpu2", "mpu_total")
+
+
+def run_configuration(config):
+    """
+    Run one simulation and return its configuration together with its metrics.
+
+    Parameters:
+    - config: Simulator arguments of the run, besides the fixed ones.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator = Simulator(
+            config["n"],
+            config["z0"],
+            config["z1"],
+            min_transactions_per_mining=10,
+            transaction_mean_gap=config["transaction_mean_gap"],
+            max_events=config["max_events"],
+            attacker_hash1=config["attacker_hash1"],
+            attacker_hash2=config["attacker_hash2"],
+            seed=config["seed"],
+        )
+        simulator.simulate()
+    return {**config, **simulator.mpu_metrics()}
+
+
+def configurations(grid, max_events):
+    """Return the Simulator arguments of every point of the grid."""
+    names = list(grid)
+    return [
+        dict(zip(names, values), max_events=max_events)
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def sweep(grid, output, max_events=10000, workers=None):
+    """
+    Run every configuration of a grid on a process pool and write one CSV row per run.
+
+    Rows are written and flushed as runs finish, so they come in completion
+    order and a partial file is usable while the sweep is still running.
+
+    Parameters:
+    - grid: Simulator argument name -> list of values.
+    - output: Path of the CSV results file.
+    - max_events: Number of events of each run.
+    - workers: Number of worker processes, the CPU count by default.
+    """
+    configs = configurations(grid, max_events)
+    fields = list(configs[0]) + list(METRICS)
+    with open(output, "w", newline="") as file, multiprocessing.Pool(
+        workers or multiprocessing.cpu_count()
+    ) as pool:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        file.flush()
+        for done, row in enumerate(pool.imap_unordered(run_configuration, configs), 1):
+            writer.writerow(row)
+            file.flush()
+            print(f"{done}/{len(configs)} runs done", file=sys.stderr)
+    return len(configs)
+
+
+def arg_values(flag, kind, default):
+    """Return the comma-separated values given after flag, or the default values."""
+    if flag not in sys.argv:
+        return default
+    return [kind(value) for value in sys.argv[sys.argv.index(flag) + 1].split(",")]
+
+
+# Usage: python3 sweep.py [--att1 A,B,...] [--att2 A,B,...] [--peers N,...] [--z0 Z,...] [--z1 Z,...]
+#        [--transaction-mean-gap T,...] [--seeds S,...] [--events EVENTS] [--workers WORKERS]
+#        [--output FILE]
+if __name__ == "__main__":
+    grid = {name: arg_values(flag, kind, default) for flag, name, kind, default in GRID}
+    max_events = arg_values("--events", int, [10000])[0]
+    workers = arg_values("--workers", int, [None])[0]
+    output = sys.argv[sys.argv.index("--output") + 1] if "--output" in sys.argv else "sweep_results.csv"
+    runs = sweep(grid, output, max_events, workers)
+    print(f"{runs} runs written to `{output}`")
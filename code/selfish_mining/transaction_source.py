@@ -0,0 +1,85 @@
+import numpy as np
+from event import GENERATE_TRANSACTIONS
+from transaction import Transaction
+
+
+class TransactionSource:
+    def __init__(self, simulator, n, transaction_mean_gap, batch_size=4096):
+        """
+        Initialize a TransactionSource object.
+
+        Every peer issues transactions as a Poisson process with mean gap
+        transaction_mean_gap, so together they form one Poisson process with
+        mean gap transaction_mean_gap / n and a uniformly chosen sender. Gaps,
+        senders, receivers and amounts are drawn in NumPy batches, and only the
+        next transaction is kept in the event queue.
+
+        Parameters:
+        - simulator: Reference to the simulator object.
+        - n: Total number of nodes in the network.
+        - transaction_mean_gap: Mean time gap between transactions of one peer.
+        - batch_size: Number of transactions drawn at a time.
+        """
+        self.simulator = simulator
+        self.n = n
+        self.mean_gap = transaction_mean_gap / n
+        self.batch_size = batch_size
+        self.generator = simulator.rng.transactions.generator
+        self._refill(0)
+
+    def _refill(self, start_time):
+        size = self.batch_size
+        self.times = (
+            start_time + np.cumsum(self.generator.exponential(self.mean_gap, size))
+        ).tolist()
+        senders = self.generator.integers(0, self.n, size)
+        # Shifting by 1..n-1 picks the receiver uniformly among the other nodes
+        receivers = (senders + self.generator.integers(1, self.n, size)) % self.n
+        self.senders = senders.tolist()
+        self.receivers = receivers.tolist()
+        self.amounts = self.generator.integers(1, 51, size).tolist()
+        self.position = 0
+
+    def schedule_next(self):
+        """Push the event of the next transaction, drawing a new batch when needed."""
+        if self.position == len(self.times):
+            self._refill(self.times[-1])
+        time = self.times[self.position]
+        self.simulator.priority_queue.push(time, GENERATE_TRANSACTIONS, 0, (time,))
+
+    def take_until(self, end_time):
+        """
+        Return the (time, sender, receiver, amount) of the next transactions
+        due before end_time, in order, and move past them.
+
+        Parameters:
+        - end_time: Time before which the transactions are taken.
+        """
+        taken = []
+        while True:
+            if self.position == len(self.times):
+                self._refill(self.times[-1])
+            i = self.position
+            if self.times[i] >= end_time:
+                return taken
+            taken.append((self.times[i], self.senders[i], self.receivers[i], self.amounts[i]))
+            self.position += 1
+
+    def generate_transaction(self, time):
+        """
+        Create the next transaction and broadcast it from its sender.
+
+        Parameters:
+        - time: Time at which the transaction is generated.
+        """
+        i = self.position
+        self.position += 1
+        transaction = Transaction(
+            self.senders[i],
+            self.receivers[i],
+            self.amounts[i],
+            time,
+            txn_id=self.simulator.new_transaction_id(),
+        )
+        self.schedule_next()
+        self.simulator.peers[transaction.sender].broadcast_transaction(transaction, time)
@@ -1,12 +1,8 @@
-import random
-
-
-def generate_distinct_random_numbers(n):
-    x = random.randint(0, n - 1)
-    y = random.randint(0, n - 1)
+def generate_distinct_random_numbers(n, rng):
+    x = rng.integers(0, n)
+    y = rng.integers(0, n)
 
     while y == x:
-        y = random.randint(0, n - 1)
+        y = rng.integers(0, n)
 
     return x, y
-
@@ -1,55 +1,51 @@
 import heapq
+import itertools
 
+# Handler IDs. An event is a heap tuple (time, seq, handler_id, target_id, payload),
+# where target_id is the index of the peer/node in the simulator and payload is
+# the tuple of positional arguments passed to the handler.
+GENERATE_TRANSACTIONS = 0
+BROADCAST_TRANSACTION = 1
+RECEIVE_TRANSACTION = 2
+RECEIVE_BLOCK = 3
+PROPAGATE_BLOCK = 4
+MINE_BLOCK = 5
+CONDITIONAL_MINE_BLOCK = 6
+MINE_NEXT_BLOCK = 7
+MULTICAST = 8
+RECEIVE_TRANSACTIONS = 9
 
-class Event:
-    def __init__(self, object, function, params, time):
-        """
-        Initialize an Event object.
-
-        Parameters:
-        - object: The object associated with the event.
-        - function: The function to be called when the event occurs.
-        - params: Parameters to be passed to the function.
-        - time: The time at which the event occurs.
-        """
-        self.object = object
-        self.function = function
-        self.params = params
-        self.time = time
-
-    def __lt__(self, other):
-        """Define less than comparison based on event time."""
-        return self.time < other.time
-
-    def __eq__(self, other):
-        """Define equality comparison based on event time."""
-        return self.time == other.time
-
-    def __gt__(self, other):
-        """Define greater than comparison based on event time."""
-        return self.time > other.time
-
-    def __le__(self, other):
-        """Define less than or equal comparison based on event time."""
-        return self.time <= other.time
+HANDLER_NAMES = (
+    "generate_transactions",
+    "broadcast_transaction",
+    "receive_transaction",
+    "receive_block",
+    "propagate_block",
+    "mine_block",
+    "conditional_mine_block",
+    "mine_next_block",
+    "multicast",
+    "receive_transactions",
+)
 
-    def __ge__(self, other):
-        """Define greater than or equal comparison based on event time."""
-        return self.time >= other.times
 
-    def __str__(self) -> str:
-        """Return a string representation of the event."""
-        return f"Object: {self.object}, Function: {self.function}, Params: {self.params}, Time: {self.time}"
+def event_str(event):
+    """Return a string representation of an event tuple."""
+    time, seq, handler_id, target_id, payload = event
+    return f"Target: {target_id}, Function: {HANDLER_NAMES[handler_id]}, Params: {payload}, Time: {time}"
 
 
 class EventPriorityQueue:
     def __init__(self):
         """Initialize an empty priority queue for events."""
         self._queue = []
+        self._seq = itertools.count()  # Breaks ties between equal times in FIFO order
 
-    def push(self, event):
+    def push(self, time, handler_id, target_id, payload):
         """Push an event into the priority queue."""
-        heapq.heappush(self._queue, event)
+        heapq.heappush(
+            self._queue, (time, next(self._seq), handler_id, target_id, payload)
+        )
 
     def pop(self):
         """Pop the event with the smallest time from the priority queue."""
@@ -59,6 +55,115 @@ class EventPriorityQueue:
         """Return the event with the smallest time without removing it from the priority queue."""
         return self._queue[0] if self._queue else None
 
+    def remove_if(self, predicate):
+        """Remove every event for which predicate(event) is true."""
+        self._queue = [event for event in self._queue if not predicate(event)]
+        heapq.heapify(self._queue)
+
     def is_empty(self):
         """Check if the priority queue is empty."""
         return len(self._queue) == 0
+
+    def __len__(self):
+        return len(self._queue)
+
+
+class CalendarQueue:
+    MIN_BUCKETS = 16
+
+    def __init__(self, bucket_width=1.0, num_buckets=MIN_BUCKETS):
+        """
+        Initialize an empty calendar queue for events.
+
+        Events are hashed by time into a ring of buckets of fixed width, each
+        bucket being a small heap. Dequeueing scans forward from the current
+        bucket, so both operations are amortized O(1) when the width is close
+        to the typical gap between events. The ring doubles or halves with the
+        number of events, and the width is re-estimated from the earliest
+        events at each resize.
+
+        Parameters:
+        - bucket_width: Initial time span covered by each bucket.
+        - num_buckets: Initial number of buckets.
+        """
+        self._seq = itertools.count()  # Breaks ties between equal times in FIFO order
+        self._size = 0
+        self._last_time = 0
+        self._setup(max(num_buckets, self.MIN_BUCKETS), bucket_width)
+
+    def _setup(self, num_buckets, bucket_width):
+        self._buckets = [[] for _ in range(num_buckets)]
+        self._width = bucket_width
+        self._current = int(self._last_time / bucket_width)  # Virtual bucket being served
+
+    def _insert(self, event):
+        virtual_bucket = int(event[0] / self._width)
+        heapq.heappush(self._buckets[virtual_bucket % len(self._buckets)], event)
+        if virtual_bucket < self._current:
+            self._current = virtual_bucket
+
+    def _resize(self, num_buckets):
+        events = [event for bucket in self._buckets for event in bucket]
+        earliest = heapq.nsmallest(25, events)
+        gaps = [
+            later[0] - earlier[0]
+            for earlier, later in zip(earliest, earliest[1:])
+            if later[0] > earlier[0]
+        ]
+        width = 3 * sum(gaps) / len(gaps) if gaps else self._width
+        if earliest:
+            self._last_time = earliest[0][0]
+        self._setup(num_buckets, width)
+        for event in events:
+            self._insert(event)
+
+    def _next_bucket(self):
+        num_buckets = len(self._buckets)
+        for virtual_bucket in range(self._current, self._current + num_buckets):
+            bucket = self._buckets[virtual_bucket % num_buckets]
+            if bucket and int(bucket[0][0] / self._width) <= virtual_bucket:
+                self._current = virtual_bucket
+                return bucket
+        # No event within one lap of the ring, jump straight to the earliest one
+        bucket = min((bucket for bucket in self._buckets if bucket), key=lambda b: b[0])
+        self._current = int(bucket[0][0] / self._width)
+        return bucket
+
+    def push(self, time, handler_id, target_id, payload):
+        """Push an event into the calendar queue."""
+        self._insert((time, next(self._seq), handler_id, target_id, payload))
+        self._size += 1
+        if self._size > 2 * len(self._buckets):
+            self._resize(2 * len(self._buckets))
+
+    def pop(self):
+        """Pop the event with the smallest time from the calendar queue."""
+        if not self._size:
+            raise IndexError("pop from an empty calendar queue")
+        event = heapq.heappop(self._next_bucket())
+        self._size -= 1
+        self._last_time = event[0]
+        if len(self._buckets) > self.MIN_BUCKETS and self._size < len(self._buckets) // 2:
+            self._resize(len(self._buckets) // 2)
+        return event
+
+    def peek(self):
+        """Return the event with the smallest time without removing it from the calendar queue."""
+        return self._next_bucket()[0] if self._size else None
+
+    def remove_if(self, predicate):
+        """Remove every event for which predicate(event) is true."""
+        for i, bucket in enumerate(self._buckets):
+            kept = [event for event in bucket if not predicate(event)]
+            if len(kept) < len(bucket):
+                heapq.heapify(kept)
+                self._buckets[i] = kept
+                self._size -= len(bucket) - len(kept)
+
+    def is_empty(self):
+        """Check if the calendar queue is empty."""
+        return self._size == 0
+
+    def __len__(self):
+        return self._size
+
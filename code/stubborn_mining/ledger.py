@@ -0,0 +1,67 @@
+INITIAL_BALANCE = 1200000
+
+
+class Ledger:
+    def __init__(self, blockchain, initial_balance=INITIAL_BALANCE):
+        """
+        Initialize a Ledger object.
+
+        The ledger keeps the account balances of a single branch, the one
+        ending at `head`, and moves between branches by undoing and replaying
+        block deltas down to and up from their common ancestor.
+
+        Parameters:
+        - blockchain: Blockchain whose blocks the ledger follows.
+        - initial_balance: Balance every account starts with.
+        """
+        self.blockchain = blockchain
+        self.initial_balance = initial_balance
+        self.head = blockchain.genesis_block
+        self.changes = {}  # Account ID -> net change along the chain ending at head
+
+    def balance(self, account_id):
+        """Return the balance of an account on the branch ending at head."""
+        return self.initial_balance + self.changes.get(account_id, 0)
+
+    def _apply(self, block, sign):
+        for txn in block.transactions:
+            if txn.sender != -1:
+                self.changes[txn.sender] = self.changes.get(txn.sender, 0) - sign * txn.amount
+            self.changes[txn.receiver] = self.changes.get(txn.receiver, 0) + sign * txn.amount
+
+    def move_to(self, block):
+        """Rebase the ledger onto the branch ending at a connected block."""
+        if block.block_id == self.head.block_id:
+            return
+        fork = self.blockchain.common_ancestor(self.head, block)
+        current = self.head
+        while current.block_id != fork.block_id:
+            self._apply(current, -1)
+            current = current.jumps[0]
+        path = []
+        current = block
+        while current.block_id != fork.block_id:
+            path.append(current)
+            current = current.jumps[0]
+        for current in reversed(path):
+            self._apply(current, 1)
+        self.head = block
+
+    def validate(self, block):
+        """
+        Check that every sender in a block can afford its payments.
+
+        Balances are taken from the block's parent branch, or from the longest
+        chain when the parent has not been connected yet.
+        """
+        parent = self.blockchain.find_block_by_id(block.previous_block_id)
+        if parent is None or not self.blockchain.is_connected(parent):
+            parent = self.blockchain.tip
+        self.move_to(parent)
+        spent = {}
+        for txn in block.transactions:
+            if txn.sender != -1:
+                spent[txn.sender] = spent.get(txn.sender, 0) + txn.amount
+                if self.balance(txn.sender) < spent[txn.sender]:
+                    return False
+        return True
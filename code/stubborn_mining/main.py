@@ -11,6 +11,9 @@ if __name__ == "__main__":
         min_transactions_per_mining=10,  # Minimum transactions per mining
         transaction_mean_gap=int(sys.argv[8]),  # Transaction mean gap
         max_events=10000,  # Maximum number of events
+        seed=int(sys.argv[sys.argv.index("--seed") + 1])
+        if "--seed" in sys.argv
+        else None,  # Seed for a reproducible run
     )
 
     # Running the simulation
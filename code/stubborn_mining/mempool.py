@@ -0,0 +1,115 @@
+import heapq
+import itertools
+from collections import OrderedDict
+
+
+class Mempool:
+    def __init__(self, capacity=None, eviction="oldest"):
+        """
+        Initialize a Mempool object.
+
+        Transactions are keyed by txn_id and kept in arrival order, so adding,
+        removing and membership checks are O(1) and block templates take the
+        oldest transactions first.
+
+        Parameters:
+        - capacity: Maximum number of transactions held, or None for no limit.
+        - eviction: Transaction dropped when the pool is full, "oldest" or "lowest_amount".
+        """
+        if eviction not in ("oldest", "lowest_amount"):
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        self.capacity = capacity
+        self.eviction = eviction
+        self._txns = OrderedDict()
+        self._by_amount = []  # (amount, seq, txn_id) heap, stale entries skipped lazily
+        self._entry_seqs = {}  # txn_id -> seq of its live _by_amount entry
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._txns)
+
+    def __contains__(self, txn_id):
+        return txn_id in self._txns
+
+    def __iter__(self):
+        return iter(self._txns.values())
+
+    def add(self, transaction):
+        """Add a transaction, evicting one if the pool is full. Return False for duplicates."""
+        if transaction.txn_id in self._txns:
+            return False
+        self._txns[transaction.txn_id] = transaction
+        if self.eviction == "lowest_amount":
+            seq = next(self._seq)
+            self._entry_seqs[transaction.txn_id] = seq
+            heapq.heappush(self._by_amount, (transaction.amount, seq, transaction.txn_id))
+        if self.capacity is not None and len(self._txns) > self.capacity:
+            self._evict()
+        return True
+
+    def add_many(self, transactions):
+        """
+        Add a batch of transactions, skipping duplicates. Return the number added.
+
+        The new transactions go in with one dict update and the pool is trimmed
+        once afterwards. For a batch of distinct transactions, none of them in
+        the pool yet, this leaves the same pool as adding them one by one.
+        """
+        new = {txn.txn_id: txn for txn in transactions if txn.txn_id not in self._txns}
+        self._txns.update(new)
+        if self.eviction == "lowest_amount":
+            entries = []
+            for txn_id, txn in new.items():
+                seq = next(self._seq)
+                self._entry_seqs[txn_id] = seq
+                entries.append((txn.amount, seq, txn_id))
+            # Re-heapifying only pays off when the batch is large next to the heap
+            if len(entries) * 8 > len(self._by_amount):
+                self._by_amount.extend(entries)
+                heapq.heapify(self._by_amount)
+            else:
+                for entry in entries:
+                    heapq.heappush(self._by_amount, entry)
+        if self.capacity is not None:
+            while len(self._txns) > self.capacity:
+                self._evict()
+        return len(new)
+
+    def _evict(self):
+        if self.eviction == "oldest":
+            self._txns.popitem(last=False)
+            return
+        while self._by_amount:
+            _, seq, txn_id = heapq.heappop(self._by_amount)
+            # Entries of removed transactions, or of earlier copies of a re-added one, are stale
+            if txn_id in self._txns and self._entry_seqs[txn_id] == seq:
+                del self._txns[txn_id]
+                del self._entry_seqs[txn_id]
+                return
+
+    def remove(self, txn_id):
+        """Remove a transaction if present."""
+        self._txns.pop(txn_id, None)
+
+    def remove_many(self, txn_ids):
+        """Remove every transaction in txn_ids that is present."""
+        for txn_id in txn_ids:
+            self._txns.pop(txn_id, None)
+        if self.eviction == "lowest_amount" and len(self._by_amount) > 2 * len(self._txns) + 64:
+            self._by_amount = [
+                entry
+                for entry in self._by_amount
+                if entry[2] in self._txns and self._entry_seqs[entry[2]] == entry[1]
+            ]
+            heapq.heapify(self._by_amount)
+            self._entry_seqs = {txn_id: seq for _, seq, txn_id in self._by_amount}
+
+    def take(self, limit=None):
+        """Remove and return up to limit of the oldest transactions (all of them if limit is None)."""
+        if limit is None or limit >= len(self._txns):
+            taken = list(self._txns.values())
+            self._txns.clear()
+            self._by_amount = []
+            self._entry_seqs = {}
+            return taken
+        return [self._txns.popitem(last=False)[1] for _ in range(limit)]
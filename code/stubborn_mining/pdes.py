@@ -0,0 +1,371 @@
+import contextlib
+import io
+import itertools
+import multiprocessing
+import sys
+import time as clock
+from collections import deque
+
+from blockchain import GENESIS_BLOCK_ID, Block
+from event import GENERATE_TRANSACTIONS, RECEIVE_BLOCK, RECEIVE_TRANSACTION
+from simulator import Simulator
+from transaction import Transaction
+
+# Constructor arguments of a Block, in order
+BLOCK_FIELDS = ("block_id", "previous_block_id", "transactions")
+
+
+def partition_nodes(graph, workers):
+    """
+    Split the nodes of a graph into 'workers' contiguous pieces of a BFS order.
+
+    Neighbours tend to land in the same piece, which keeps cross-partition
+    traffic low. Returns the owning worker of every node.
+    """
+    order = []
+    seen = [False] * graph.n
+    for root in range(graph.n):
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for neighbour in graph.adjacency[node]:
+                if not seen[neighbour]:
+                    seen[neighbour] = True
+                    queue.append(neighbour)
+    owner = [0] * graph.n
+    for position, node in enumerate(order):
+        owner[node] = position * workers // graph.n
+    return owner
+
+
+def node_summary(node):
+    """
+    Return the longest chain and the block count of a node's view.
+
+    Blocks record no miner here, so each chain entry is the block ID and the
+    (sender, receiver, amount, timestamp) of each of its transactions.
+    """
+    chain = node.blockchain.get_longest_chain()
+    return {
+        "chain": [
+            (
+                block.block_id,
+                [(txn.sender, txn.receiver, txn.amount, txn.timestamp) for txn in block.transactions],
+            )
+            for block in chain
+        ],
+        "blocks": len(node.blockchain.blocks),
+        "blocks_received": node.blocks_received,
+    }
+
+
+class Partition:
+    def __init__(self, simulator, owner, worker):
+        """
+        Initialize a Partition object, the part of a simulator run by one worker.
+
+        Every worker builds the same simulator from the same seed, but only
+        runs the events of the nodes it owns. Messages for nodes of other
+        workers are held in an outbox until the end of the window. Blocks are
+        sent along with the ancestors the receiving worker may lack.
+
+        Transactions reach their receivers without delay, so they cannot wait
+        for the end of a window. They do not depend on the simulation state
+        either, so each worker draws the shared transaction stream ahead of
+        time, creates the transactions of its own senders, and sends them to
+        the workers of their receivers, its own included, one lookahead ahead.
+
+        Parameters:
+        - simulator: Simulator of the worker.
+        - owner: Owning worker of every node.
+        - worker: Index of this worker.
+        """
+        self.simulator = simulator
+        self.owner = owner
+        self.worker = worker
+        self.outbox = {}  # Worker -> (block records, block deliveries, transactions) sent to it
+        self.shipped = {}  # Worker -> IDs of the blocks already sent to it
+
+    def is_local(self, node_id):
+        """Check if a node belongs to this partition."""
+        return self.owner[node_id] == self.worker
+
+    def route(self, handler_id, deliveries):
+        """
+        Return the deliveries to local nodes, sending the ones for other
+        partitions to the outbox.
+
+        Parameters:
+        - handler_id: Handler of every delivery.
+        - deliveries: (time, target ID, payload) of each delivery.
+        """
+        local = []
+        for delivery in deliveries:
+            time, target_id, payload = delivery
+            worker = self.owner[target_id]
+            if worker == self.worker:
+                local.append(delivery)
+            elif handler_id == RECEIVE_BLOCK:
+                block, arrival, sender = payload
+                records, events, _ = self._message(worker)
+                records.extend(self._new_records(block, worker))
+                events.append((time, target_id, block.block_id, arrival, sender))
+            else:
+                raise ValueError(f"Cannot send handler {handler_id} across partitions")
+        return local
+
+    def _message(self, worker):
+        return self.outbox.setdefault(worker, ([], [], []))
+
+    def _new_records(self, block, worker):
+        # The receiving DAG needs every ancestor, so send the ones it may lack, oldest first
+        shipped = self.shipped.setdefault(worker, {GENESIS_BLOCK_ID})
+        records = []
+        while block.block_id not in shipped:
+            shipped.add(block.block_id)
+            records.append(tuple(getattr(block, field) for field in BLOCK_FIELDS))
+            block = block.jumps[0]
+        records.reverse()
+        return records
+
+    def send_transactions(self, end_time):
+        """
+        Create the transactions of local senders due before end_time and send
+        each to the workers of its receivers.
+
+        Parameters:
+        - end_time: Time before which the transactions are created.
+        """
+        simulator = self.simulator
+        for time, sender, receiver, amount in simulator.transaction_source.take_until(end_time):
+            if not self.is_local(sender):
+                continue
+            txn_id = simulator.new_transaction_id()
+            targets = {}  # Worker -> receiving peers, in the order of the sender's connections
+            for peer in simulator.peers[sender].connections:
+                targets.setdefault(self.owner[peer.node.id], []).append(peer.node.id)
+            for worker, target_ids in targets.items():
+                self._message(worker)[2].append(
+                    (time, sender, receiver, amount, txn_id, target_ids)
+                )
+
+    def take_outbox(self):
+        """Return and clear the messages for the workers."""
+        outbox, self.outbox = self.outbox, {}
+        return outbox
+
+    def receive(self, messages):
+        """
+        Insert the block and transaction deliveries sent by the workers.
+
+        Parameters:
+        - messages: (block records, block deliveries, transactions) triples.
+        """
+        simulator = self.simulator
+        dag = simulator.dag
+        events = []
+        transactions = []
+        for records, deliveries, sent in messages:
+            for record in records:
+                if record[0] not in dag.block_index:
+                    dag.add(Block(*record))
+            events.extend(deliveries)
+            transactions.extend(sent)
+        # Order does not depend on which worker sent what
+        events.sort(key=lambda event: (event[0], event[1], event[4]))
+        for time, target_id, block_id, arrival, sender in events:
+            block = dag.block_index[block_id]
+            simulator.priority_queue.push(
+                time, RECEIVE_BLOCK, target_id, (block, arrival, sender)
+            )
+        # Deliver each transaction as its sender's broadcast_transaction would
+        transactions.sort(key=lambda sent: (sent[0], sent[1]))
+        for time, sender, receiver, amount, txn_id, target_ids in transactions:
+            transaction = Transaction(sender, receiver, amount, time, txn_id=txn_id)
+            if simulator.transaction_batch_quantum is not None:
+                for target_id in target_ids:
+                    simulator.batch_transaction(target_id, transaction, time)
+            else:
+                simulator.push_multicast(
+                    RECEIVE_TRANSACTION,
+                    [(time, target_id, (transaction, time)) for target_id in target_ids],
+                )
+
+    def next_time(self):
+        """Return the time of the next local event, or infinity if there is none."""
+        event = self.simulator.priority_queue.peek()
+        return float("inf") if event is None else event[0]
+
+
+def _worker_main(connection, simulator_kwargs, owner, worker, workers):
+    # Every worker gives out block and transaction IDs from its own residue class
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator = Simulator(
+            **simulator_kwargs, transaction_ids=itertools.count(worker, workers)
+        )
+    simulator.dag.block_ids = itertools.count(GENESIS_BLOCK_ID + 1 + worker, workers)
+    # Transactions are sent ahead by send_transactions instead of generated by events
+    simulator.priority_queue.remove_if(lambda event: event[2] == GENERATE_TRANSACTIONS)
+    partition = Partition(simulator, owner, worker)
+    simulator.partition = partition
+    while True:
+        command, end_time, messages, send_until = connection.recv()
+        if command == "window":
+            partition.receive(messages)
+            simulator.simulate_until(end_time)
+            partition.send_transactions(send_until)
+            connection.send((partition.next_time(), partition.take_outbox()))
+        else:
+            connection.send(
+                {
+                    node.id: node_summary(node)
+                    for node in simulator.nodes
+                    if partition.is_local(node.id)
+                }
+            )
+            connection.close()
+            return
+
+
+class ParallelSimulator:
+    def __init__(self, workers, **simulator_kwargs):
+        """
+        Initialize a ParallelSimulator object.
+
+        The nodes are split across worker processes, each running its own
+        event queue. Runs are conservative and synchronous (YAWNS): every
+        window starts at the earliest pending event time of any worker, and
+        ends one lookahead later, the smallest latency of a link between two
+        partitions. Nothing sent in a window can arrive before the window
+        ends, so each worker runs its window independently and cross-partition
+        messages are exchanged in batches at the boundaries. Node draws come from
+        per-node streams, so, apart from block and transaction IDs, a seeded
+        run matches Simulator.simulate_until for the same arguments.
+
+        Parameters:
+        - workers: Number of worker processes.
+        - simulator_kwargs: Arguments of Simulator, including n, z0, z1 and a
+          seed. The global mining clock (block_interval) and fast propagation
+          are not supported.
+        """
+        if simulator_kwargs.get("seed") is None:
+            raise ValueError("Parallel runs need a seed to build the same network in every worker")
+        if simulator_kwargs.get("block_interval") is not None:
+            raise ValueError("The global mining clock cannot be partitioned")
+        if simulator_kwargs.get("propagation", "hop") != "hop":
+            raise ValueError("Fast propagation reads the state of nodes in other partitions")
+        self.workers = workers
+        self.simulator_kwargs = simulator_kwargs
+        with contextlib.redirect_stdout(io.StringIO()):
+            simulator = Simulator(**simulator_kwargs)
+        self.owner = partition_nodes(simulator.graph, workers)
+        self.lookahead = float("inf")
+        for i in range(simulator.graph.n):
+            for k in range(simulator._indptr[i], simulator._indptr[i + 1]):
+                if self.owner[i] != self.owner[simulator._indices[k]]:
+                    self.lookahead = min(self.lookahead, simulator._latencies[k])
+        self.windows = 0
+
+    def run(self, end_time):
+        """
+        Simulate the events that occur before end_time.
+
+        Returns the longest chain and block counts of every node, as given by
+        node_summary.
+        """
+        context = multiprocessing.get_context()
+        connections = []
+        processes = []
+        for worker in range(self.workers):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_worker_main,
+                args=(child, self.simulator_kwargs, self.owner, worker, self.workers),
+            )
+            process.start()
+            connections.append(parent)
+            processes.append(process)
+        next_times = [None] * self.workers
+        inboxes = [[] for _ in range(self.workers)]
+        window_end = 0
+        while True:
+            # Transactions are sent one lookahead ahead, so the next window,
+            # which ends no later, finds all of its transactions in the inboxes
+            send_until = min(window_end + self.lookahead, end_time)
+            for connection, inbox in zip(connections, inboxes):
+                connection.send(("window", window_end, inbox, send_until))
+            inboxes = [[] for _ in range(self.workers)]
+            for worker, connection in enumerate(connections):
+                next_times[worker], outbox = connection.recv()
+                for destination, message in outbox.items():
+                    inboxes[destination].append(message)
+            self.windows += 1
+            # Lower bound on the time of any event not yet processed
+            lower_bound = min(next_times)
+            if send_until < end_time:
+                lower_bound = min(lower_bound, send_until)
+            for inbox in inboxes:
+                for _, deliveries, transactions in inbox:
+                    for sent in (deliveries, transactions):
+                        if sent:
+                            lower_bound = min(lower_bound, min(event[0] for event in sent))
+            if lower_bound >= end_time:
+                break
+            window_end = min(lower_bound + self.lookahead, send_until)
+        results = {}
+        for connection in connections:
+            connection.send(("results", None, None, None))
+            results.update(connection.recv())
+        for process in processes:
+            process.join()
+        return results
+
+
+def sequential_summary(end_time, **simulator_kwargs):
+    """Run Simulator up to end_time in this process and return node_summary of every node."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulator = Simulator(**simulator_kwargs)
+    simulator.simulate_until(end_time)
+    return {node.id: node_summary(node) for node in simulator.nodes}
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+
+    def option(name, default, kind):
+        return kind(args[args.index(name) + 1]) if name in args else default
+
+    kwargs = dict(
+        n=option("--peers", 100, int),
+        z0=option("--z0", 0.5, float),
+        z1=option("--z1", 0.5, float),
+        min_transactions_per_mining=10,
+        transaction_mean_gap=option("--transaction-mean-gap", 10, float),
+        seed=option("--seed", 0, int),
+    )
+    if "--att1" in args or "--att2" in args:
+        sys.exit("--att1 and --att2 only apply in selfish_mining, stubborn_mining has no attackers")
+    end_time = option("--until", 5000, float)
+    workers = option("--workers", multiprocessing.cpu_count(), int)
+
+    start = clock.perf_counter()
+    simulator = ParallelSimulator(workers, **kwargs)
+    results = simulator.run(end_time)
+    elapsed = clock.perf_counter() - start
+    chain = results[0]["chain"]
+    print(f"workers: {workers}, lookahead: {simulator.lookahead:.2f}, windows: {simulator.windows}")
+    print(f"length of longest chain of node 0: {len(chain)}, blocks seen: {results[0]['blocks']}")
+    print(f"elapsed: {elapsed:.2f}s")
+    if "--check" in args:
+        expected = sequential_summary(end_time, **kwargs)
+        same = all(
+            [content for _, content in results[i]["chain"]]
+            == [content for _, content in expected[i]["chain"]]
+            and results[i]["blocks"] == expected[i]["blocks"]
+            for i in expected
+        )
+        print("matches sequential run:", same)
@@ -1,5 +1,7 @@
 class Transaction:
-    def __init__(self, sender, receiver, amount, timestamp=0):
+    __slots__ = ("sender", "receiver", "amount", "timestamp", "txn_id")
+
+    def __init__(self, sender, receiver, amount, timestamp=0, *, txn_id):
         """
         Initialize a Transaction object.
 
@@ -8,11 +10,13 @@ class Transaction:
         - receiver: ID of the receiver.
         - amount: Amount of coins being transferred.
         - timestamp: Timestamp of the transaction.
+        - txn_id: ID of the transaction, unique within its simulation.
         """
         self.sender = sender
         self.receiver = receiver
         self.amount = amount
         self.timestamp = timestamp
+        self.txn_id = txn_id
 
     def __str__(self) -> str:
         """